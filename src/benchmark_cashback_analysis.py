@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.services import aggregate_cashback_by_category
+
+# Количество синтетических операций и повторов замера для каждого числа процессов
+BENCHMARK_ROWS = 4_000_000
+BENCHMARK_REPEATS = 3
+
+
+def generate_benchmark_operations(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Функция генерирует синтетические успешные расходные операции с рассчитанным кэшбэком.
+    :param rows: Количество операций.
+    :param seed: Начальное значение генератора случайных чисел.
+    :return: Данные в формате DataFrame с колонками "Номер карты", "Дата платежа", "Категория"
+    и "Рассчитанный кэшбэк"."""
+
+    generator = np.random.default_rng(seed)
+    cards = [f"*{number:04d}" for number in range(50)]
+    categories = [f"Категория {number}" for number in range(40)]
+    return pd.DataFrame(
+        {
+            "Номер карты": generator.choice(cards, rows),
+            "Дата платежа": pd.to_datetime("2018-01-01") + pd.to_timedelta(generator.integers(0, 2000, rows), "D"),
+            "Категория": generator.choice(categories, rows),
+            "Рассчитанный кэшбэк": generator.integers(0, 100000, rows) / 100,
+        }
+    )
+
+
+if __name__ == "__main__":
+
+    # Необязательные аргументы - количество операций (по умолчанию BENCHMARK_ROWS) и наибольшее количество
+    # процессов (по умолчанию количество ядер процессора)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else BENCHMARK_ROWS
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    operations = generate_benchmark_operations(rows)
+    serial_result = aggregate_cashback_by_category(operations)
+
+    print(f"Операций: {rows}, ядер процессора: {os.cpu_count()}")
+    for workers in range(1, max_workers + 1):
+        timings = []
+        for _ in range(BENCHMARK_REPEATS):
+            start_time = time.perf_counter()
+            result = aggregate_cashback_by_category(operations, workers=workers)
+            timings.append(time.perf_counter() - start_time)
+        # Параллельный расчет обязан давать тот же результат, что и последовательный
+        pd.testing.assert_series_equal(result, serial_result)
+        print(f"Процессов: {workers}, лучшее время: {min(timings):.3f} с")
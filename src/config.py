@@ -10,6 +10,15 @@ LOGS_DIR = BASE_DIR / "logs"
 log_utils_file = LOGS_DIR / "utils.log"
 log_views_file = LOGS_DIR / "views.log"
 log_services_file = LOGS_DIR / "services.log"
+log_shared_dataset_file = LOGS_DIR / "shared_dataset.log"
+log_search_file = LOGS_DIR / "search.log"
+log_profiling_file = LOGS_DIR / "profiling.log"
+log_quotes_transport_file = LOGS_DIR / "quotes_transport.log"
+log_reports_file = LOGS_DIR / "reports.log"
+log_currency_rates_file = LOGS_DIR / "currency_rates.log"
+
+# Директория, в которую записываются результаты профилирования (pstats, collapsed stacks, пиковая память)
+PROFILES_DIR = LOGS_DIR / "profiles"
 
 
 # Чтобы создать автоматически необходимую директорию (../logs/), если ее не существует еще мы используем эту функцию.
@@ -28,3 +37,19 @@ excel_file_user_operations = DATA_DIR / "operations.xlsx"
 # Определение пути к JSON-файлу c настройками пользователя, который размещается в проекте в директории (../data/)
 DATA_DIR = BASE_DIR / "data"
 json_file_user_settings = DATA_DIR / "user_settings.json"
+
+
+# Определение пути к CSV-файлу с локальной таблицей исторических курсов валют к рублю (кэш ответов API)
+currency_rates_cache_file = DATA_DIR / "currency_rates.csv"
+
+
+# Определение пути к директории, в которую записывается общий для всех процессов (memory-mapped) набор операций
+SHARED_OPERATIONS_DIR = DATA_DIR / "shared_operations"
+
+
+# Определение пути к директории с записанными ответами API курсов валют и стоимости акций (для работы без сети)
+QUOTES_FIXTURES_DIR = DATA_DIR / "quotes_fixtures"
+
+
+# Определение пути к директории с недельными и месячными отчетами о расходах (по файлу на каждый период)
+REPORTS_DIR = DATA_DIR / "reports"
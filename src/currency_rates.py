@@ -0,0 +1,350 @@
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import requests
+from dotenv import load_dotenv
+
+from config import currency_rates_cache_file
+from logger import get_logger_for_currency_rates
+from src.utils import get_cached_for_dataset
+
+# Инициализирую логгер для currency_rates
+logger = get_logger_for_currency_rates(__name__)
+
+
+def _fetch_currency_rates_window(
+    currencies: List[str], start_date: pd.Timestamp, end_date: pd.Timestamp, api_key: str
+) -> Optional[pd.DataFrame]:
+    """Функция загружает из API исторические курсы валют к рублю одним запросом (период не длиннее 365 дней).
+    :param currencies: Перечень валют (например, ["USD", "EUR"]).
+    :param start_date: Дата начала периода.
+    :param end_date: Дата окончания периода.
+    :param api_key: Ключ API.
+    :return: Данные в формате DataFrame с колонками "Дата", "Валюта", "Курс" или None, если запрос не удался."""
+
+    try:
+        url = "https://api.apilayer.com/exchangerates_data/timeseries"
+        payload = {
+            "start_date": start_date.strftime("%Y-%m-%d"),
+            "end_date": end_date.strftime("%Y-%m-%d"),
+            "base": "RUB",
+            "symbols": ",".join(currencies),
+        }
+        headers = {"apikey": api_key}
+        response = requests.request("GET", url, headers=headers, params=payload)
+        if response.status_code != 200:
+            logger.error(f"Ошибка при запросе истории курсов валют: {response.text}")
+            return None
+        # В ответе курс рубля к валюте (base=RUB), поэтому рублей за единицу валюты - это 1 / курс
+        rates = pd.DataFrame.from_dict(response.json().get("rates", {}), orient="index")
+        rates = rates.rename_axis("Дата").reset_index()
+        rates = rates.melt(id_vars="Дата", var_name="Валюта", value_name="Курс")
+        rates["Курс"] = 1 / rates["Курс"]
+        return rates
+    except requests.RequestException as e:
+        logger.error(f"Ошибка при запросе API истории курсов валют: {e}")
+        return None
+
+
+def _split_currency_rates_period(
+    start_date: pd.Timestamp, end_date: pd.Timestamp
+) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """Функция разбивает период на части не длиннее 365 дней (ограничение API на длину периода).
+    :param start_date: Дата начала периода.
+    :param end_date: Дата окончания периода.
+    :return: Список периодов (начало, окончание)."""
+
+    windows = []
+    window_start = pd.Timestamp(start_date).normalize()
+    while window_start <= end_date:
+        window_end = min(window_start + pd.Timedelta(days=364), pd.Timestamp(end_date).normalize())
+        windows.append((window_start, window_end))
+        window_start = window_end + pd.Timedelta(days=1)
+    return windows
+
+
+def _get_currency_rates_api_key() -> str:
+    """Функция возвращает ключ API курсов валют из переменных окружения.
+    :return: Ключ API."""
+
+    logger.debug("Загрузка API ключа из .env файла")
+    load_dotenv()
+    api_key = os.getenv("API_KEY_EXCHANGE_RATES")
+    if not api_key:
+        logger.error("API_KEY_EXCHANGE_RATES не найден в переменных окружения.env")
+        raise ValueError("API_KEY_EXCHANGE_RATES не найден в переменных окружения.env")
+    return api_key
+
+
+def _combine_currency_rates(rates_frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Функция объединяет загруженные из API курсы валют в одну таблицу.
+    :param rates_frames: Курсы из _fetch_currency_rates_window().
+    :return: Данные в формате DataFrame с колонками "Валюта", "Дата", "Курс"."""
+
+    if not rates_frames:
+        return pd.DataFrame(columns=["Валюта", "Дата", "Курс"])
+    rates_history = pd.concat(rates_frames, ignore_index=True).dropna(subset=["Курс"])
+    rates_history["Дата"] = pd.to_datetime(rates_history["Дата"])
+    return rates_history[["Валюта", "Дата", "Курс"]]
+
+
+def read_currency_rates_table(path_to_file: Union[str, Path] = currency_rates_cache_file) -> pd.DataFrame:
+    """Функция считывает локальную таблицу исторических курсов валют из CSV-файла.
+    :param path_to_file: Путь к CSV-файлу.
+    :return: Данные в формате DataFrame с колонками "Валюта", "Дата", "Курс" или пустой DataFrame."""
+
+    try:
+        return pd.read_csv(path_to_file, parse_dates=["Дата"])
+    except FileNotFoundError:
+        logger.debug(f"Локальная таблица курсов валют не найдена: {path_to_file}")
+        return pd.DataFrame(columns=["Валюта", "Дата", "Курс"])
+
+
+def _get_currency_rates_periods_file(path_to_file: Union[str, Path]) -> Path:
+    """Функция возвращает путь к файлу загруженных периодов, который лежит рядом с таблицей курсов.
+    :param path_to_file: Путь к CSV-файлу таблицы курсов.
+    :return: Путь к CSV-файлу периодов (например, currency_rates_periods.csv)."""
+
+    path_to_file = Path(path_to_file)
+    return path_to_file.with_name(f"{path_to_file.stem}_periods.csv")
+
+
+def read_currency_rates_periods(
+    path_to_file: Union[str, Path] = currency_rates_cache_file, rates_table: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """Функция считывает периоды, за которые курсы уже запрашивались успешно (в том числе выходные и праздники,
+    за которые API курсов не возвращает). Если файла периодов нет (таблица курсов создана раньше), периоды
+    определяются по первой и последней дате курса каждой валюты.
+    :param path_to_file: Путь к CSV-файлу таблицы курсов.
+    :param rates_table: Таблица курсов (если уже прочитана).
+    :return: Данные в формате DataFrame с колонками "Валюта", "Начало", "Окончание"."""
+
+    try:
+        return pd.read_csv(_get_currency_rates_periods_file(path_to_file), parse_dates=["Начало", "Окончание"])
+    except FileNotFoundError:
+        logger.debug("Файл загруженных периодов курсов не найден, периоды определяются по таблице курсов")
+    if rates_table is None:
+        rates_table = read_currency_rates_table(path_to_file)
+    rates_dates = pd.to_datetime(rates_table["Дата"])
+    return (
+        rates_dates.groupby(rates_table["Валюта"])
+        .agg(["min", "max"])
+        .rename(columns={"min": "Начало", "max": "Окончание"})
+        .rename_axis("Валюта")
+        .reset_index()
+    )
+
+
+def _subtract_periods(
+    start_date: pd.Timestamp, end_date: pd.Timestamp, covered_periods: List[Tuple[pd.Timestamp, pd.Timestamp]]
+) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """Функция возвращает части периода, которые не покрыты загруженными периодами.
+    :param start_date: Дата начала периода.
+    :param end_date: Дата окончания периода.
+    :param covered_periods: Загруженные периоды (начало, окончание).
+    :return: Список непокрытых периодов (начало, окончание)."""
+
+    missing_periods = []
+    period_start = start_date
+    for covered_start, covered_end in sorted(covered_periods):
+        if covered_end < period_start:
+            continue
+        if covered_start > end_date:
+            break
+        if covered_start > period_start:
+            missing_periods.append((period_start, covered_start - pd.Timedelta(days=1)))
+        period_start = max(period_start, covered_end + pd.Timedelta(days=1))
+    if period_start <= end_date:
+        missing_periods.append((period_start, end_date))
+    return missing_periods
+
+
+# Периоды, запрос курсов за которые завершился ошибкой в текущем запуске: {(валюта, начало, окончание)}.
+# Повторно в этом запуске они не запрашиваются, чтобы недоступный API не замедлял каждое обновление таблицы
+_failed_currency_rates_periods: Set[Tuple[str, pd.Timestamp, pd.Timestamp]] = set()
+
+
+def update_currency_rates_table(
+    currencies: List[str],
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    path_to_file: Union[str, Path] = currency_rates_cache_file,
+) -> pd.DataFrame:
+    """Функция дополняет локальную таблицу курсов валют недостающими периодами и сохраняет ее на диск вместе
+    с перечнем загруженных периодов. Периоды, за которые курсы уже запрашивались (даже если API не вернул курсов),
+    и периоды, запрос за которые уже завершился ошибкой в текущем запуске, повторно не запрашиваются.
+    :param currencies: Перечень валют.
+    :param start_date: Дата начала периода.
+    :param end_date: Дата окончания периода.
+    :param path_to_file: Путь к CSV-файлу.
+    :return: Обновленная таблица курсов в формате DataFrame."""
+
+    rates_table = read_currency_rates_table(path_to_file)
+    rates_periods = read_currency_rates_periods(path_to_file, rates_table)
+    start_date, end_date = pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize()
+
+    # Определяю недостающие периоды по каждой валюте (с разбивкой по 365 дней) и объединяю валюты с одинаковым
+    # периодом в один запрос
+    missing_periods: Dict[Tuple[pd.Timestamp, pd.Timestamp], List[str]] = {}
+    for currency in currencies:
+        currency_periods = rates_periods.loc[rates_periods["Валюта"] == currency]
+        covered_periods = list(
+            zip(pd.to_datetime(currency_periods["Начало"]), pd.to_datetime(currency_periods["Окончание"]))
+        )
+        for period_start, period_end in _subtract_periods(start_date, end_date, covered_periods):
+            for window in _split_currency_rates_period(period_start, period_end):
+                if (currency, *window) not in _failed_currency_rates_periods:
+                    missing_periods.setdefault(window, []).append(currency)
+
+    if not missing_periods:
+        logger.debug("Локальная таблица курсов валют уже содержит весь период")
+        return rates_table
+
+    api_key = _get_currency_rates_api_key()
+    # Курс за сегодняшний день может еще измениться, поэтому загруженным считаю период не позже вчерашнего дня
+    last_final_date = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    new_rates: List[pd.DataFrame] = []
+    new_periods: List[Dict[str, Any]] = []
+    for (period_start, period_end), period_currencies in missing_periods.items():
+        logger.debug(f"Загрузка курсов {period_currencies} за период {period_start.date()} - {period_end.date()}")
+        rates = _fetch_currency_rates_window(period_currencies, period_start, period_end, api_key)
+        if rates is None:
+            _failed_currency_rates_periods.update(
+                (currency, period_start, period_end) for currency in period_currencies
+            )
+            continue
+        new_rates.append(rates)
+        if period_start <= last_final_date:
+            new_periods.extend(
+                {"Валюта": currency, "Начало": period_start, "Окончание": min(period_end, last_final_date)}
+                for currency in period_currencies
+            )
+
+    if not new_periods and not new_rates:
+        logger.warning("Не удалось загрузить недостающие курсы валют, таблица курсов не изменена")
+        return rates_table
+
+    rates_frames = [frame for frame in (rates_table, _combine_currency_rates(new_rates)) if not frame.empty]
+    if rates_frames:
+        rates_table = (
+            pd.concat(rates_frames, ignore_index=True)
+            .drop_duplicates(subset=["Валюта", "Дата"], keep="last")
+            .sort_values(by=["Валюта", "Дата"], ignore_index=True)
+        )
+    periods_frames = [
+        frame for frame in (rates_periods, pd.DataFrame(new_periods, columns=rates_periods.columns)) if not frame.empty
+    ]
+    if periods_frames:
+        rates_periods = pd.concat(periods_frames, ignore_index=True)
+    Path(path_to_file).parent.mkdir(parents=True, exist_ok=True)
+    rates_table.to_csv(path_to_file, index=False)
+    rates_periods.sort_values(by=["Валюта", "Начало"]).to_csv(
+        _get_currency_rates_periods_file(path_to_file), index=False, date_format="%Y-%m-%d"
+    )
+    logger.debug(f"Локальная таблица курсов валют обновлена и сохранена: {path_to_file}")
+    return rates_table
+
+
+def get_foreign_currencies(input_data: pd.DataFrame) -> List[str]:
+    """Функция возвращает перечень валют (кроме рубля), в которых есть операции.
+    :param input_data: Данные в формате DataFrame с колонками "Валюта платежа" и/или "Валюта операции".
+    :return: Отсортированный перечень валют."""
+
+    currencies: Set[str] = set()
+    for currency_column in ("Валюта платежа", "Валюта операции"):
+        if currency_column in input_data.columns:
+            currencies.update(str(currency) for currency in input_data[currency_column].dropna().unique())
+    currencies.discard("RUB")
+    return sorted(currencies)
+
+
+def normalize_operations_currency(input_data: pd.DataFrame, rates_table: pd.DataFrame) -> pd.DataFrame:
+    """Функция переводит суммы операций в иностранной валюте в рубли по курсу на "Дата платежа" (as-of: последний
+    известный курс на эту дату или раньше). Расчет векторный через pd.merge_asof без запросов к API.
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :param rates_table: Таблица курсов с колонками "Валюта", "Дата", "Курс".
+    :return: Данные в формате DataFrame, где "Сумма платежа" и "Сумма операции" в рублях, а валюта - "RUB"."""
+
+    normalized_data = input_data
+    payment_dates = pd.to_datetime(input_data["Дата платежа"], errors="coerce").astype("datetime64[ns]")
+    rates = rates_table.assign(**{"Дата": pd.to_datetime(rates_table["Дата"]).astype("datetime64[ns]")})
+    rates = rates.sort_values(by="Дата")
+
+    for amount_column, currency_column in (("Сумма платежа", "Валюта платежа"), ("Сумма операции", "Валюта операции")):
+        if amount_column not in input_data.columns or currency_column not in input_data.columns:
+            continue
+        currency = input_data[currency_column].astype(object)
+        is_foreign = (currency.notnull() & (currency != "RUB") & payment_dates.notnull()).to_numpy()
+        if not is_foreign.any() or rates.empty:
+            continue
+
+        logger.debug(f"Перевод в рубли колонки '{amount_column}' для операций в иностранной валюте")
+        foreign_operations = pd.DataFrame(
+            {
+                "row": np.flatnonzero(is_foreign),
+                "Дата": payment_dates.to_numpy()[is_foreign],
+                "Валюта": currency.to_numpy()[is_foreign].astype(str),
+            }
+        ).sort_values(by="Дата")
+        matched_rates = pd.merge_asof(foreign_operations, rates, on="Дата", by="Валюта", direction="backward")
+
+        operation_rates = np.full(len(input_data), np.nan)
+        operation_rates[matched_rates["row"].to_numpy()] = matched_rates["Курс"].to_numpy(dtype=float)
+        is_converted = ~np.isnan(operation_rates)
+        missing_rates_count = int((is_foreign & ~is_converted).sum())
+        if missing_rates_count:
+            logger.warning(f"Нет курса для {missing_rates_count} операций, суммы оставлены без изменений")
+
+        if normalized_data is input_data:
+            normalized_data = input_data.copy()
+        amounts = normalized_data[amount_column].to_numpy(dtype=float)
+        normalized_data[amount_column] = np.where(is_converted, (amounts * operation_rates).round(2), amounts)
+        normalized_data[currency_column] = np.where(is_converted, "RUB", currency.to_numpy())
+
+    return normalized_data
+
+
+def fill_currency_rates_table(
+    input_data: pd.DataFrame, path_to_file: Union[str, Path] = currency_rates_cache_file
+) -> pd.DataFrame:
+    """Функция-этап подготовки данных (вне обработки запросов): дополняет локальную таблицу курсов валют
+    курсами за весь период операций в иностранной валюте.
+    :param input_data: Данные в формате DataFrame с операциями.
+    :param path_to_file: Путь к CSV-файлу таблицы курсов.
+    :return: Обновленная таблица курсов в формате DataFrame."""
+
+    foreign_currencies = get_foreign_currencies(input_data)
+    if not foreign_currencies:
+        logger.debug("Операций в иностранной валюте нет, таблица курсов не обновляется")
+        return read_currency_rates_table(path_to_file)
+
+    payment_dates = input_data["Дата платежа"]
+    if not pd.api.types.is_datetime64_any_dtype(payment_dates):
+        payment_dates = pd.to_datetime(payment_dates, format="%d.%m.%Y", errors="coerce")
+    return update_currency_rates_table(foreign_currencies, payment_dates.min(), payment_dates.max(), path_to_file)
+
+
+def convert_operations_to_rub(input_data: pd.DataFrame) -> pd.DataFrame:
+    """Функция-этап нормализации: если есть операции в иностранной валюте, то переводит суммы операций в рубли
+    по локальной таблице курсов. Запросов к API здесь нет: таблица дополняется заранее через
+    fill_currency_rates_table() (python src/main.py --update-rates), операции без курса остаются без изменений.
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :return: Данные в формате DataFrame с суммами в рублях (или исходные данные, если все операции в рублях)."""
+
+    foreign_currencies = get_foreign_currencies(input_data)
+    if not foreign_currencies:
+        return input_data
+
+    logger.debug(f"Нормализация операций в валютах {foreign_currencies} в рубли")
+    try:
+        rates_stat = Path(currency_rates_cache_file).stat()
+        rates_version: Optional[Tuple[Any, ...]] = (rates_stat.st_mtime_ns, rates_stat.st_size)
+    except OSError:
+        rates_version = None
+    rates_table = get_cached_for_dataset(
+        ("currency_rates",), rates_version, lambda: read_currency_rates_table(currency_rates_cache_file)
+    )
+    return normalize_operations_currency(input_data, rates_table)
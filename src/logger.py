@@ -1,6 +1,17 @@
 import logging
 
-from config import initialize_directories, log_utils_file, log_views_file, log_services_file
+from config import (
+    initialize_directories,
+    log_currency_rates_file,
+    log_profiling_file,
+    log_quotes_transport_file,
+    log_reports_file,
+    log_search_file,
+    log_services_file,
+    log_shared_dataset_file,
+    log_utils_file,
+    log_views_file,
+)
 
 # Инициализируем необходимые директории (сейчас это только инициализация (../logs/) для логов)
 initialize_directories()
@@ -43,3 +54,81 @@ def get_logger_for_services(name: str) -> logging.Logger:
     logger_get_services.setLevel(logging.DEBUG)
 
     return logger_get_services
+
+
+def get_logger_for_shared_dataset(name: str) -> logging.Logger:
+    """Функция создает и возвращает настроенный логгер с заданным именем для модуля shared_dataset.py."""
+
+    logger_get_shared_dataset = logging.getLogger(name)
+    file_handler = logging.FileHandler(log_shared_dataset_file, "w")
+    file_formatter = logging.Formatter("%(asctime)s - %(name)s - %(funcName)s - %(levelname)s: %(message)s")
+    file_handler.setFormatter(file_formatter)
+    logger_get_shared_dataset.addHandler(file_handler)
+    logger_get_shared_dataset.setLevel(logging.DEBUG)
+
+    return logger_get_shared_dataset
+
+
+def get_logger_for_search(name: str) -> logging.Logger:
+    """Функция создает и возвращает настроенный логгер с заданным именем для модуля search.py."""
+
+    logger_get_search = logging.getLogger(name)
+    file_handler = logging.FileHandler(log_search_file, "w")
+    file_formatter = logging.Formatter("%(asctime)s - %(name)s - %(funcName)s - %(levelname)s: %(message)s")
+    file_handler.setFormatter(file_formatter)
+    logger_get_search.addHandler(file_handler)
+    logger_get_search.setLevel(logging.DEBUG)
+
+    return logger_get_search
+
+
+def get_logger_for_profiling(name: str) -> logging.Logger:
+    """Функция создает и возвращает настроенный логгер с заданным именем для модуля profiling.py."""
+
+    logger_get_profiling = logging.getLogger(name)
+    file_handler = logging.FileHandler(log_profiling_file, "w")
+    file_formatter = logging.Formatter("%(asctime)s - %(name)s - %(funcName)s - %(levelname)s: %(message)s")
+    file_handler.setFormatter(file_formatter)
+    logger_get_profiling.addHandler(file_handler)
+    logger_get_profiling.setLevel(logging.DEBUG)
+
+    return logger_get_profiling
+
+
+def get_logger_for_quotes_transport(name: str) -> logging.Logger:
+    """Функция создает и возвращает настроенный логгер с заданным именем для модуля quotes_transport.py."""
+
+    logger_get_quotes_transport = logging.getLogger(name)
+    file_handler = logging.FileHandler(log_quotes_transport_file, "w")
+    file_formatter = logging.Formatter("%(asctime)s - %(name)s - %(funcName)s - %(levelname)s: %(message)s")
+    file_handler.setFormatter(file_formatter)
+    logger_get_quotes_transport.addHandler(file_handler)
+    logger_get_quotes_transport.setLevel(logging.DEBUG)
+
+    return logger_get_quotes_transport
+
+
+def get_logger_for_reports(name: str) -> logging.Logger:
+    """Функция создает и возвращает настроенный логгер с заданным именем для модуля reports.py."""
+
+    logger_get_reports = logging.getLogger(name)
+    file_handler = logging.FileHandler(log_reports_file, "w")
+    file_formatter = logging.Formatter("%(asctime)s - %(name)s - %(funcName)s - %(levelname)s: %(message)s")
+    file_handler.setFormatter(file_formatter)
+    logger_get_reports.addHandler(file_handler)
+    logger_get_reports.setLevel(logging.DEBUG)
+
+    return logger_get_reports
+
+
+def get_logger_for_currency_rates(name: str) -> logging.Logger:
+    """Функция создает и возвращает настроенный логгер с заданным именем для модуля currency_rates.py."""
+
+    logger_get_currency_rates = logging.getLogger(name)
+    file_handler = logging.FileHandler(log_currency_rates_file, "w")
+    file_formatter = logging.Formatter("%(asctime)s - %(name)s - %(funcName)s - %(levelname)s: %(message)s")
+    file_handler.setFormatter(file_formatter)
+    logger_get_currency_rates.addHandler(file_handler)
+    logger_get_currency_rates.setLevel(logging.DEBUG)
+
+    return logger_get_currency_rates
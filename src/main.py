@@ -1,17 +1,44 @@
-from config import excel_file_user_operations
+import sys
+
+from config import SHARED_OPERATIONS_DIR, excel_file_user_operations
+from src.currency_rates import fill_currency_rates_table
+from src.profiling import enable_profiling
 from src.services import get_cashback_analysis_by_category
+from src.shared_dataset import publish_shared_operations
+from src.utils import read_data_with_user_operations
 from src.views import response_for_main_page
 
 
 if __name__ == "__main__":
 
+    # Флаг --profile включает профилирование (то же самое, что переменная окружения PROFILE_DASHBOARD=1),
+    # результаты записываются в директорию logs/profiles
+    if "--profile" in sys.argv[1:]:
+        enable_profiling()
+
+    # Флаг --publish-shared записывает операции из Excel-файла в общий (memory-mapped) набор в
+    # data/shared_operations, рабочие процессы с USE_SHARED_OPERATIONS=1 подключаются к нему вместо чтения файла
+    if "--publish-shared" in sys.argv[1:]:
+        publish_shared_operations(
+            read_data_with_user_operations(excel_file_user_operations, allow_shared=False), SHARED_OPERATIONS_DIR
+        )
+
+    # Флаг --update-rates дополняет локальную таблицу курсов валют за весь период операций. Главная страница
+    # и анализ кэшбэка к API курсов не обращаются и переводят суммы в рубли только по этой таблице
+    if "--update-rates" in sys.argv[1:]:
+        fill_currency_rates_table(read_data_with_user_operations(excel_file_user_operations))
+
     user_date = input(
         "Введите дату для вывода данных по банковским операциям (с 01.mm.yyyy по dd.mm.yyyy), где "
         "dd.mm.yyyy это указанная вами дата: "
     )
-    print(response_for_main_page(user_date))
+    print(response_for_main_page(user_date, pretty=True))
     year, month = input(
         "Введите через `-` год и месяц за который будет проводится анализ категорий повышенного "
         "кэшбэка (например: 2021-08): "
     ).split("-")
-    print(get_cashback_analysis_by_category(file=excel_file_user_operations, user_year=year, user_month=month))
+    print(
+        get_cashback_analysis_by_category(
+            file=excel_file_user_operations, user_year=year, user_month=month, pretty=True
+        )
+    )
@@ -0,0 +1,238 @@
+import cProfile
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar, Union, cast
+
+from dotenv import load_dotenv
+
+from config import PROFILES_DIR
+from logger import get_logger_for_profiling
+
+# Инициализирую логгер для profiling
+logger = get_logger_for_profiling(__name__)
+
+# Интервал (в секундах) между снимками стека для collapsed stacks (формат для построения flamegraph)
+SAMPLING_INTERVAL = 0.005
+
+FunctionType = TypeVar("FunctionType", bound=Callable[..., Any])
+
+load_dotenv()
+
+# Состояние профилирования: включено ли оно, куда записывать результаты и сколько внешних этапов сейчас
+# используют tracemalloc и cProfile. Оба инструмента одни на процесс (начиная с Python 3.12 второй одновременно
+# включенный cProfile.Profile вызывает ValueError), поэтому внешние этапы из разных потоков пользуются ими совместно
+_profiling_state: Dict[str, Any] = {
+    "enabled": os.getenv("PROFILE_DASHBOARD") == "1",
+    "output_dir": PROFILES_DIR,
+    "tracemalloc_users": 0,
+    "profiler": None,
+    "profiler_users": 0,
+}
+_profiling_lock = threading.Lock()
+
+# Выполняемые этапы (этапы могут быть вложенными) и записи о завершенных этапах хранятся отдельно для каждого
+# потока, чтобы запросы, обрабатываемые параллельно, не смешивали свои этапы
+_thread_state = threading.local()
+
+
+def _get_thread_stages() -> List[Dict[str, Any]]:
+    """Функция возвращает стек выполняемых этапов текущего потока.
+    :return: Список этапов вида {"name": название, "peak": пиковая память}."""
+
+    if not hasattr(_thread_state, "stages"):
+        _thread_state.stages = []
+        _thread_state.records = []
+    return cast(List[Dict[str, Any]], _thread_state.stages)
+
+
+def _acquire_profiler() -> bool:
+    """Функция подключает внешний этап к общему cProfile.Profile: первый этап включает профилировщик, остальные
+    увеличивают счетчик. Если в процессе уже работает сторонний профилировщик, этап выполняется без cProfile
+    (только сбор стеков и tracemalloc).
+    :return: True, если этап подключен к профилировщику."""
+
+    with _profiling_lock:
+        if _profiling_state["profiler_users"] > 0:
+            _profiling_state["profiler_users"] += 1
+            return True
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            logger.warning(f"cProfile не включен, этап профилируется только сбором стеков и tracemalloc: {e}")
+            return False
+        _profiling_state["profiler"] = profiler
+        _profiling_state["profiler_users"] = 1
+        return True
+
+
+def _release_profiler() -> Optional[cProfile.Profile]:
+    """Функция отключает внешний этап от общего cProfile.Profile. Последний этап выключает профилировщик.
+    :return: Остановленный профилировщик, если этап был последним, иначе None."""
+
+    with _profiling_lock:
+        _profiling_state["profiler_users"] -= 1
+        if _profiling_state["profiler_users"] > 0:
+            return None
+        profiler = cast(cProfile.Profile, _profiling_state["profiler"])
+        profiler.disable()
+        _profiling_state["profiler"] = None
+        return profiler
+
+
+def enable_profiling(output_dir: Union[str, Path, None] = None) -> None:
+    """Функция включает профилирование (аналог переменной окружения PROFILE_DASHBOARD=1 или флага --profile).
+    :param output_dir: Директория для результатов профилирования (по умолчанию logs/profiles)."""
+
+    _profiling_state["enabled"] = True
+    if output_dir is not None:
+        _profiling_state["output_dir"] = Path(output_dir)
+    logger.info(f"Профилирование включено, результаты будут записаны в {_profiling_state['output_dir']}")
+
+
+def disable_profiling() -> None:
+    """Функция выключает профилирование."""
+
+    _profiling_state["enabled"] = False
+    logger.info("Профилирование выключено")
+
+
+def _sample_stacks(thread_id: int, stop_event: threading.Event, stacks: Counter) -> None:
+    """Функция периодически снимает стек вызовов потока и считает одинаковые стеки (collapsed stacks).
+    :param thread_id: Идентификатор профилируемого потока.
+    :param stop_event: Событие для остановки сбора.
+    :param stacks: Счетчик стеков вида "модуль:функция;модуль:функция" (изменяется на месте)."""
+
+    while not stop_event.wait(SAMPLING_INTERVAL):
+        frame = sys._current_frames().get(thread_id)
+        names: List[str] = []
+        while frame is not None:
+            names.append(f"{Path(frame.f_code.co_filename).stem}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        if names:
+            stacks[";".join(reversed(names))] += 1
+
+
+def _write_profile(
+    stage: str, profiler: Optional[cProfile.Profile], stacks: Counter, records: List[Dict[str, Any]]
+) -> None:
+    """Функция записывает результаты профилирования этапа в директорию профилей: pstats, collapsed stacks
+    и сводку по времени и пиковой памяти всех вложенных этапов.
+    :param stage: Название внешнего этапа.
+    :param profiler: Остановленный cProfile.Profile (None - pstats не записывается).
+    :param stacks: Счетчик стеков из _sample_stacks().
+    :param records: Записи о времени и памяти этапов."""
+
+    output_dir = Path(_profiling_state["output_dir"])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    file_prefix = output_dir / f"{stage}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+
+    if profiler is not None:
+        profiler.dump_stats(f"{file_prefix}.pstats")
+    with open(f"{file_prefix}.collapsed", "w") as collapsed_file:
+        collapsed_file.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+    with open(f"{file_prefix}_memory.json", "w") as memory_file:
+        json.dump(records, memory_file, ensure_ascii=False, indent=4)
+
+    logger.info(f"Результаты профилирования этапа '{stage}' записаны: {file_prefix}.*")
+
+
+@contextmanager
+def profile_stage(stage: str) -> Iterator[None]:
+    """Контекстный менеджер профилирования этапа. Если профилирование выключено, ничего не делает.
+    Внешний этап профилируется общим для процесса cProfile и сбором стеков своего потока, для всех этапов
+    (включая вложенные) через tracemalloc фиксируются время выполнения и пиковая память.
+    :param stage: Название этапа."""
+
+    if not _profiling_state["enabled"]:
+        yield
+        return
+
+    stages = _get_thread_stages()
+    is_outer_stage = not stages
+    if is_outer_stage:
+        _thread_state.records = []
+        # tracemalloc общий для процесса: запускаю его с первым внешним этапом и останавливаю с последним,
+        # если он не был запущен до профилирования
+        with _profiling_lock:
+            if _profiling_state["tracemalloc_users"] == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _profiling_state["tracemalloc_users"] = 1
+            elif _profiling_state["tracemalloc_users"] > 0:
+                _profiling_state["tracemalloc_users"] += 1
+        uses_profiler = _acquire_profiler()
+        stacks: Counter = Counter()
+        stop_event = threading.Event()
+        sampler = threading.Thread(
+            target=_sample_stacks, args=(threading.get_ident(), stop_event, stacks), daemon=True
+        )
+        sampler.start()
+
+    # Пиковая память у tracemalloc одна на процесс, поэтому перед этапом сбрасываю пик, а пик, накопленный
+    # к этому моменту внешним этапом, запоминаю в его записи, чтобы учесть при завершении внешнего этапа.
+    # Если параллельно профилируются другие потоки, пик включает и их память
+    start_memory, peak_before_stage = tracemalloc.get_traced_memory()
+    if stages:
+        outer_stage = stages[-1]
+        outer_stage["peak"] = max(outer_stage["peak"], peak_before_stage)
+    tracemalloc.reset_peak()
+    current_stage: Dict[str, Any] = {"name": stage, "peak": 0}
+    stages.append(current_stage)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_time = time.perf_counter() - start_time
+        _, traced_peak = tracemalloc.get_traced_memory()
+        stage_peak = max(traced_peak, current_stage["peak"])
+        stages.pop()
+        stage_path = ".".join([outer["name"] for outer in stages] + [stage])
+        _thread_state.records.append(
+            {
+                "stage": stage_path,
+                "seconds": round(elapsed_time, 6),
+                "start_memory_mb": round(start_memory / 2**20, 3),
+                "peak_memory_mb": round(stage_peak / 2**20, 3),
+            }
+        )
+        logger.info(f"Этап '{stage_path}': {elapsed_time:.3f} с, пиковая память {stage_peak / 2**20:.3f} МБ")
+
+        if is_outer_stage:
+            # pstats записывает этап, который выключил общий профилировщик: в нем есть вызовы всех этапов,
+            # выполнявшихся параллельно с ним
+            profiler = _release_profiler() if uses_profiler else None
+            stop_event.set()
+            sampler.join()
+            _write_profile(stage, profiler, stacks, _thread_state.records)
+            with _profiling_lock:
+                if _profiling_state["tracemalloc_users"] > 0:
+                    _profiling_state["tracemalloc_users"] -= 1
+                    if _profiling_state["tracemalloc_users"] == 0:
+                        tracemalloc.stop()
+
+
+def profiled(stage: str) -> Callable[[FunctionType], FunctionType]:
+    """Декоратор, который выполняет функцию внутри profile_stage(stage).
+    :param stage: Название этапа.
+    :return: Декоратор."""
+
+    def decorator(function: FunctionType) -> FunctionType:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _profiling_state["enabled"]:
+                return function(*args, **kwargs)
+            with profile_stage(stage):
+                return function(*args, **kwargs)
+
+        return cast(FunctionType, wrapper)
+
+    return decorator
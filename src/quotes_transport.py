@@ -0,0 +1,181 @@
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+import requests
+from dotenv import load_dotenv
+
+from config import QUOTES_FIXTURES_DIR
+from logger import get_logger_for_quotes_transport
+
+# Инициализирую логгер для quotes_transport
+logger = get_logger_for_quotes_transport(__name__)
+
+# Режимы транспорта: "live" - обычные запросы к API, "record" - запросы к API с записью ответов в локальное
+# хранилище, "replay" - ответы только из хранилища, без сети
+TRANSPORT_MODES = ("live", "record", "replay")
+
+load_dotenv()
+
+# Состояние транспорта: режим, хранилище записанных ответов и параметры имитации задержки и ошибок в режиме replay
+_transport_state: Dict[str, Any] = {
+    "mode": os.getenv("QUOTES_TRANSPORT_MODE", "live"),
+    "store_dir": QUOTES_FIXTURES_DIR,
+    "latency": float(os.getenv("QUOTES_REPLAY_LATENCY", "0")),
+    "latency_jitter": float(os.getenv("QUOTES_REPLAY_LATENCY_JITTER", "0")),
+    "error_rate": float(os.getenv("QUOTES_REPLAY_ERROR_RATE", "0")),
+    "error_status": None,
+    "random": random.Random(os.getenv("QUOTES_REPLAY_SEED")),
+    "responses": {},
+}
+
+# Запросы могут выполняться из нескольких потоков (нагрузочное тестирование), поэтому общий генератор случайных
+# чисел и кэш прочитанных ответов защищаю блокировкой
+_transport_lock = threading.Lock()
+
+
+def configure_quotes_transport(
+    mode: str = "live",
+    store_dir: Union[str, Path, None] = None,
+    latency: float = 0.0,
+    latency_jitter: float = 0.0,
+    error_rate: float = 0.0,
+    error_status: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> None:
+    """Функция настраивает транспорт запросов к API курсов валют и стоимости акций
+    (аналог переменных окружения QUOTES_TRANSPORT_MODE, QUOTES_REPLAY_LATENCY и т.д.).
+    :param mode: Режим транспорта: "live", "record" или "replay".
+    :param store_dir: Директория хранилища записанных ответов (по умолчанию data/quotes_fixtures).
+    :param latency: Имитируемая задержка ответа в режиме replay (в секундах).
+    :param latency_jitter: Случайная добавка к задержке от 0 до latency_jitter секунд.
+    :param error_rate: Доля запросов (от 0 до 1), которые в режиме replay завершаются ошибкой.
+    :param error_status: HTTP-статус имитируемой ошибки. Если не указан, имитируется сетевая ошибка
+    (requests.ConnectionError).
+    :param seed: Начальное значение генератора случайных чисел для воспроизводимых прогонов."""
+
+    if mode not in TRANSPORT_MODES:
+        logger.error(f"Неизвестный режим транспорта: {mode}")
+        raise ValueError(f"Неизвестный режим транспорта: {mode}. Допустимые режимы: {', '.join(TRANSPORT_MODES)}")
+    if not 0 <= error_rate <= 1:
+        logger.error(f"Доля ошибок должна быть от 0 до 1: {error_rate}")
+        raise ValueError(f"Доля ошибок должна быть от 0 до 1: {error_rate}")
+
+    with _transport_lock:
+        _transport_state.update(
+            {
+                "mode": mode,
+                "store_dir": Path(store_dir) if store_dir is not None else QUOTES_FIXTURES_DIR,
+                "latency": latency,
+                "latency_jitter": latency_jitter,
+                "error_rate": error_rate,
+                "error_status": error_status,
+                "random": random.Random(seed),
+                "responses": {},
+            }
+        )
+    logger.info(
+        f"Транспорт котировок: режим - {mode}, задержка - {latency} с (+ до {latency_jitter} с), "
+        f"доля ошибок - {error_rate}"
+    )
+
+
+def _fixture_path(fixture_key: str) -> Path:
+    """Функция возвращает путь к файлу записанного ответа.
+    :param fixture_key: Ключ запроса (например, "stock_prices_AAPL").
+    :return: Путь к JSON-файлу в хранилище."""
+
+    return Path(_transport_state["store_dir"]) / f"{fixture_key}.json"
+
+
+def _record_response(fixture_key: str, response: requests.Response) -> None:
+    """Функция записывает ответ API в хранилище. Записываются только статус и тело ответа, поэтому ключи API
+    из адреса запроса и заголовков в хранилище не попадают.
+    :param fixture_key: Ключ запроса.
+    :param response: Ответ API."""
+
+    fixture_path = _fixture_path(fixture_key)
+    fixture_path.parent.mkdir(parents=True, exist_ok=True)
+    fixture = {"status_code": response.status_code, "text": response.text}
+    # Сначала пишу во временный файл, а потом атомарно подменяю, чтобы параллельные запросы не прочитали
+    # наполовину записанный ответ
+    temporary_path = fixture_path.with_name(f"{fixture_path.name}.{threading.get_ident()}.tmp")
+    with open(temporary_path, "w", encoding="utf-8") as fixture_file:
+        json.dump(fixture, fixture_file, ensure_ascii=False)
+    os.replace(temporary_path, fixture_path)
+    with _transport_lock:
+        _transport_state["responses"][fixture_key] = fixture
+    logger.debug(f"Ответ для '{fixture_key}' записан в {fixture_path}")
+
+
+def _build_response(status_code: int, text: str) -> requests.Response:
+    """Функция собирает объект requests.Response из статуса и тела ответа.
+    :param status_code: HTTP-статус.
+    :param text: Тело ответа.
+    :return: Объект requests.Response."""
+
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = text.encode("utf-8")
+    response.encoding = "utf-8"
+    return response
+
+
+def _replay_response(fixture_key: str) -> requests.Response:
+    """Функция возвращает записанный ответ из хранилища с имитацией задержки и ошибок.
+    :param fixture_key: Ключ запроса.
+    :return: Объект requests.Response."""
+
+    with _transport_lock:
+        fixture = _transport_state["responses"].get(fixture_key)
+        random_generator = _transport_state["random"]
+        delay = _transport_state["latency"] + random_generator.uniform(0, _transport_state["latency_jitter"])
+        is_error = random_generator.random() < _transport_state["error_rate"]
+
+    if fixture is None:
+        try:
+            with open(_fixture_path(fixture_key), encoding="utf-8") as fixture_file:
+                fixture = json.load(fixture_file)
+        except FileNotFoundError:
+            logger.error(f"В хранилище нет записанного ответа для '{fixture_key}'")
+            raise requests.ConnectionError(f"В хранилище нет записанного ответа для '{fixture_key}'")
+        with _transport_lock:
+            _transport_state["responses"][fixture_key] = fixture
+
+    if delay > 0:
+        time.sleep(delay)
+    if is_error:
+        logger.debug(f"Имитация ошибки для '{fixture_key}'")
+        if _transport_state["error_status"] is None:
+            raise requests.ConnectionError(f"Имитация сетевой ошибки для '{fixture_key}'")
+        return _build_response(_transport_state["error_status"], "Имитация ошибки API")
+    return _build_response(fixture["status_code"], fixture["text"])
+
+
+def is_replay_mode() -> bool:
+    """Функция проверяет, что транспорт работает в режиме replay (ответы только из хранилища, без сети).
+    :return: True, если включен режим replay."""
+
+    return bool(_transport_state["mode"] == "replay")
+
+
+def send_quote_request(fixture_key: str, send_request: Callable[[], requests.Response]) -> requests.Response:
+    """Функция выполняет запрос к API котировок через текущий режим транспорта.
+    :param fixture_key: Ключ запроса в хранилище записанных ответов (например, "exchange_rates_USD").
+    :param send_request: Функция без аргументов, выполняющая настоящий запрос к API
+    (например, functools.partial(requests.get, url)).
+    :return: Ответ API (настоящий или записанный)."""
+
+    mode = _transport_state["mode"]
+    if mode == "replay":
+        return _replay_response(fixture_key)
+
+    response = send_request()
+    # Записываю только успешные ответы, чтобы ошибка API не заменила в хранилище ранее записанный ответ
+    if mode == "record" and response.status_code == 200:
+        _record_response(fixture_key, response)
+    return response
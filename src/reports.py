@@ -0,0 +1,269 @@
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from logger import get_logger_for_reports
+from src.utils import calculate_operations_cashback, compile_cashback_rules, dumps_json_response
+
+# Инициализирую логгер для reports
+logger = get_logger_for_reports(__name__)
+
+# Типы периодов отчетов: имя директории с файлами отчетов -> колонка с меткой периода
+REPORT_PERIODS = {"weekly": "Неделя", "monthly": "Месяц"}
+
+# Разрезы расходов в отчете: ключ в отчете -> колонка со значением разреза
+REPORT_DIMENSIONS = {"by_category": "Категория", "by_weekday": "День недели", "by_hour": "Час"}
+
+WEEKDAY_NAMES = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+HOUR_LABELS = [f"{hour:02d}" for hour in range(24)]
+
+
+def _add_period_labels(operation_dates: pd.Series) -> pd.DataFrame:
+    """Функция формирует метки периодов по датам операций: неделя в формате ISO ("2023-W01") и месяц ("2023-01").
+    :param operation_dates: "Дата операции" в формате datetime.
+    :return: Данные в формате DataFrame с колонками "Неделя" и "Месяц"."""
+
+    # Метки считаю один раз на каждый день истории, а операциям раздаю по коду дня (дней намного меньше, чем операций)
+    day_codes, unique_days = pd.factorize(operation_dates.dt.normalize())
+    day_dates = pd.Series(pd.DatetimeIndex(unique_days))
+    iso_calendar = day_dates.dt.isocalendar()
+    week_labels = iso_calendar["year"].astype(str) + "-W" + iso_calendar["week"].astype(str).str.zfill(2)
+    month_labels = day_dates.dt.strftime("%Y-%m")
+    return pd.DataFrame(
+        {
+            "Неделя": week_labels.to_numpy(dtype=object)[day_codes],
+            "Месяц": month_labels.to_numpy(dtype=object)[day_codes],
+        },
+        index=operation_dates.index,
+    )
+
+
+def _parse_operation_dates(input_data: pd.DataFrame) -> pd.Series:
+    """Функция преобразует "Дата операции" в datetime (если она еще не преобразована).
+    :param input_data: Данные в формате DataFrame с колонкой "Дата операции".
+    :return: Series с датами операций."""
+
+    operation_dates = input_data["Дата операции"]
+    if pd.api.types.is_datetime64_any_dtype(operation_dates):
+        return operation_dates
+    return pd.to_datetime(operation_dates, format="%d.%m.%Y %H:%M:%S", errors="coerce")
+
+
+def _get_capped_month_operations(input_data: pd.DataFrame, new_data: pd.DataFrame) -> pd.DataFrame:
+    """Функция отбирает операции из тех же карт и месяцев "Дата платежа", что и новые операции. При месячном лимите
+    кэшбэка новая операция (в том числе задним числом) меняет кэшбэк остальных операций карты за этот месяц.
+    :param input_data: Вся история операций, уже включая new_data.
+    :param new_data: Новые операции.
+    :return: Операции из input_data за затронутые месяцы затронутых карт."""
+
+    def card_month_keys(operations: pd.DataFrame) -> pd.Series:
+        payment_dates = operations["Дата платежа"]
+        if not pd.api.types.is_datetime64_any_dtype(payment_dates):
+            payment_dates = pd.to_datetime(payment_dates, format="%d.%m.%Y", errors="coerce")
+        keys: pd.Series = operations["Номер карты"].astype(str) + "|" + payment_dates.dt.strftime("%Y-%m")
+        return keys
+
+    return input_data.loc[card_month_keys(input_data).isin(set(card_month_keys(new_data).dropna()))]
+
+
+def prepare_report_operations(
+    input_data: pd.DataFrame, cashback_rules: Optional[Dict[str, Any]] = None
+) -> pd.DataFrame:
+    """Функция отбирает успешные расходные операции и добавляет к ним все, что нужно для отчетов: сумму расходов,
+    рассчитанный кэшбэк, день недели, час и метки недели и месяца по "Дата операции".
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :param cashback_rules: Правила кэшбэка из пользовательских настроек (необязательно).
+    :return: Данные в формате DataFrame с колонками "Номер карты", "Категория", "День недели", "Час",
+    "Неделя", "Месяц", "Сумма расходов" и "Рассчитанный кэшбэк"."""
+
+    operation_dates = _parse_operation_dates(input_data)
+    spending = input_data.loc[
+        (input_data["Статус"] == "OK")
+        & (input_data["Сумма платежа"] < 0)
+        & input_data["Номер карты"].notnull()
+        & operation_dates.notnull()
+    ]
+    operation_dates = operation_dates[spending.index]
+
+    # Кэшбэк считается по всей истории, чтобы месячный лимит учитывался так же, как на остальных страницах
+    report_operations = pd.DataFrame(
+        {
+            "Номер карты": spending["Номер карты"].astype(str),
+            "Категория": spending["Категория"].astype(object).fillna("Без категории").astype(str),
+            "День недели": np.array(WEEKDAY_NAMES)[operation_dates.dt.weekday.to_numpy()],
+            "Час": np.array(HOUR_LABELS)[operation_dates.dt.hour.to_numpy()],
+            "Сумма расходов": spending["Сумма платежа"].abs(),
+            "Рассчитанный кэшбэк": calculate_operations_cashback(spending, cashback_rules),
+        },
+        index=spending.index,
+    )
+    return report_operations.join(_add_period_labels(operation_dates))
+
+
+def aggregate_report_periods(
+    report_operations: pd.DataFrame, periods: Optional[Dict[str, Set[str]]] = None
+) -> pd.DataFrame:
+    """Функция за один сгруппированный проход считает расходы, кэшбэк и количество операций для всех периодов
+    (недели и месяцы), всех карт и всех разрезов (категория, день недели, час). Для этого операции один раз
+    разворачиваются в длинную таблицу (тип периода, период, разрез, значение), которая группируется целиком.
+    :param report_operations: Операции из prepare_report_operations().
+    :param periods: Периоды, которые нужно посчитать, например {"weekly": {"2023-W01"}, "monthly": {"2023-01"}}
+    (по умолчанию - все периоды истории).
+    :return: Данные в формате DataFrame с индексом ("Тип периода", "Период", "Номер карты", "Разрез", "Значение")
+    и колонками "Сумма расходов", "Кэшбэк" и "Количество операций"."""
+
+    long_frames = []
+    for period_type, period_column in REPORT_PERIODS.items():
+        period_operations = report_operations
+        if periods is not None:
+            period_operations = report_operations.loc[
+                report_operations[period_column].isin(periods.get(period_type, set()))
+            ]
+        for dimension, dimension_column in REPORT_DIMENSIONS.items():
+            long_frames.append(
+                pd.DataFrame(
+                    {
+                        "Тип периода": period_type,
+                        "Период": period_operations[period_column].to_numpy(),
+                        "Номер карты": period_operations["Номер карты"].to_numpy(),
+                        "Разрез": dimension,
+                        "Значение": period_operations[dimension_column].to_numpy(),
+                        "Сумма расходов": period_operations["Сумма расходов"].to_numpy(),
+                        "Кэшбэк": period_operations["Рассчитанный кэшбэк"].to_numpy(),
+                    }
+                )
+            )
+    long_operations = pd.concat(long_frames, ignore_index=True)
+
+    logger.debug(f"Группировка операций для отчетов: строк в длинной таблице - {len(long_operations)}")
+    grouped = long_operations.groupby(["Тип периода", "Период", "Номер карты", "Разрез", "Значение"], sort=True)
+    aggregated = grouped.agg(
+        **{
+            "Сумма расходов": ("Сумма расходов", "sum"),
+            "Кэшбэк": ("Кэшбэк", "sum"),
+            "Количество операций": ("Сумма расходов", "size"),
+        }
+    )
+    return aggregated.round({"Сумма расходов": 2, "Кэшбэк": 2})
+
+
+def _build_period_reports(aggregated: pd.DataFrame) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Функция собирает отчеты всех периодов по каждой карте за один проход по сгруппированным строкам.
+    :param aggregated: Результат aggregate_report_periods().
+    :return: Словарь {(тип периода, период): {"Номер карты": {"total_spent", "cashback", "operations",
+    "by_category", "by_weekday", "by_hour"}}}."""
+
+    rows = aggregated.reset_index()
+    # Порядок строк внутри разреза: категории по убыванию расходов, дни недели и часы - в календарном порядке
+    dimensions = rows["Разрез"].to_numpy()
+    row_order = np.select(
+        [dimensions == "by_weekday", dimensions == "by_hour"],
+        [
+            rows["Значение"].map({name: rank for rank, name in enumerate(WEEKDAY_NAMES)}).to_numpy(dtype=float),
+            rows["Значение"].map({label: rank for rank, label in enumerate(HOUR_LABELS)}).to_numpy(dtype=float),
+        ],
+        default=-rows["Сумма расходов"].to_numpy(),
+    )
+    rows = rows.assign(Порядок=row_order).sort_values(
+        by=["Тип периода", "Период", "Номер карты", "Разрез", "Порядок"], kind="stable"
+    )
+
+    period_reports: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for period_type, period, card, dimension, value, spent, cashback, operations in zip(
+        rows["Тип периода"].tolist(),
+        rows["Период"].tolist(),
+        rows["Номер карты"].tolist(),
+        rows["Разрез"].tolist(),
+        rows["Значение"].tolist(),
+        rows["Сумма расходов"].tolist(),
+        rows["Кэшбэк"].tolist(),
+        rows["Количество операций"].tolist(),
+    ):
+        cards = period_reports.setdefault((period_type, period), {})
+        if card not in cards:
+            cards[card] = {"total_spent": 0.0, "cashback": 0.0, "operations": 0}
+            cards[card].update({dimension_name: {} for dimension_name in REPORT_DIMENSIONS})
+        card_report = cards[card]
+        card_report[dimension][value] = {"spent": spent, "cashback": cashback, "operations": operations}
+        # Итоги по карте считаю по разрезу категорий: каждая операция попадает в нем ровно в одну строку
+        if dimension == "by_category":
+            card_report["total_spent"] = round(card_report["total_spent"] + spent, 2)
+            card_report["cashback"] = round(card_report["cashback"] + cashback, 2)
+            card_report["operations"] += operations
+    return period_reports
+
+
+def write_period_reports(aggregated: pd.DataFrame, reports_dir: Union[str, Path]) -> List[Path]:
+    """Функция записывает отчеты по периодам в отдельные файлы: reports_dir/<тип периода>/<период>.json.
+    :param aggregated: Результат aggregate_report_periods().
+    :param reports_dir: Директория для отчетов.
+    :return: Список путей к записанным файлам."""
+
+    written_files = []
+    for (period_type, period), cards in _build_period_reports(aggregated).items():
+        report_path = Path(reports_dir) / period_type / f"{period}.json"
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        # Пишу во временный файл и атомарно подменяю, чтобы читатели не увидели наполовину записанный отчет
+        temporary_path = report_path.with_name(f"{report_path.name}.tmp")
+        with open(temporary_path, "w", encoding="utf-8") as report_file:
+            report_file.write(dumps_json_response({"period": period, "cards": cards}))
+        os.replace(temporary_path, report_path)
+        written_files.append(report_path)
+    logger.info(f"Записано файлов отчетов: {len(written_files)}")
+    return written_files
+
+
+def generate_spending_reports(
+    input_data: pd.DataFrame,
+    reports_dir: Union[str, Path],
+    cashback_rules: Optional[Dict[str, Any]] = None,
+    periods: Optional[Dict[str, Set[str]]] = None,
+) -> List[Path]:
+    """Функция формирует недельные и месячные отчеты по каждой карте (расходы по категориям, дням недели, часам
+    "Дата операции" и начисленный кэшбэк) и записывает их по файлам периодов.
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :param reports_dir: Директория для отчетов.
+    :param cashback_rules: Правила кэшбэка из пользовательских настроек (необязательно).
+    :param periods: Периоды, которые нужно сформировать (по умолчанию - все периоды истории).
+    :return: Список путей к записанным файлам."""
+
+    logger.debug("Подготовка операций для отчетов")
+    report_operations = prepare_report_operations(input_data, cashback_rules)
+    if report_operations.empty:
+        logger.warning("Нет расходных операций для формирования отчетов")
+        return []
+    aggregated = aggregate_report_periods(report_operations, periods)
+    return write_period_reports(aggregated, reports_dir)
+
+
+def update_spending_reports(
+    input_data: pd.DataFrame,
+    new_data: pd.DataFrame,
+    reports_dir: Union[str, Path],
+    cashback_rules: Optional[Dict[str, Any]] = None,
+) -> List[Path]:
+    """Функция перезаписывает только отчеты за недели и месяцы, в которые попали новые операции (а при месячном
+    лимите кэшбэка - и все периоды операций тех же карт за те же месяцы). Отчеты за остальные периоды
+    не изменились и остаются на диске как есть.
+    :param input_data: Вся история операций, уже включая new_data.
+    :param new_data: Новые операции.
+    :param reports_dir: Директория для отчетов.
+    :param cashback_rules: Правила кэшбэка из пользовательских настроек (необязательно).
+    :return: Список путей к перезаписанным файлам."""
+
+    new_dates = _parse_operation_dates(new_data).dropna()
+    if new_dates.empty:
+        return []
+    # При месячном лимите кэшбэка новая операция меняет кэшбэк других операций карты за тот же месяц, поэтому
+    # перезаписываю и все периоды этих операций (например, другие недели месяца)
+    if compile_cashback_rules(cashback_rules)["monthly_cap"] is not None:
+        new_dates = _parse_operation_dates(_get_capped_month_operations(input_data, new_data)).dropna()
+    period_labels = _add_period_labels(new_dates)
+    affected_periods = {
+        period_type: set(period_labels[period_column]) for period_type, period_column in REPORT_PERIODS.items()
+    }
+    logger.debug(f"Периоды отчетов, затронутые новыми операциями: {affected_periods}")
+    return generate_spending_reports(input_data, reports_dir, cashback_rules, periods=affected_periods)
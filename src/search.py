@@ -0,0 +1,197 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional, Union, cast
+
+import numpy as np
+import pandas as pd
+
+from logger import get_logger_for_search
+from src.utils import calculate_operations_cashback
+
+# Инициализирую логгер для search
+logger = get_logger_for_search(__name__)
+
+# Регулярное выражение для разбиения "Описание" на слова (токены)
+TOKEN_PATTERN = r"\w+"
+
+# Наибольшее количество слов запросов в кэше совпадений по подстроке (слова запросов задают пользователи,
+# поэтому кэш ограничен, при переполнении удаляются слова, добавленные раньше всех)
+SUBSTRING_CACHE_SIZE = 1024
+_substring_cache_lock = threading.Lock()
+
+
+def _tokenize(text: str) -> List[str]:
+    """Функция разбивает строку поискового запроса на слова в нижнем регистре.
+    :param text: Строка поискового запроса.
+    :return: Список слов."""
+
+    return re.findall(TOKEN_PATTERN, text.lower())
+
+
+def _group_row_ids(keys: pd.Series) -> Dict[str, np.ndarray]:
+    """Функция группирует номера строк по ключам (словам или MCC) без цикла по строкам.
+    :param keys: Series, где индекс - номер строки, а значение - ключ.
+    :return: Словарь {ключ: отсортированный массив номеров строк (uint32)}."""
+
+    keys = keys.dropna()
+    # Одно слово может встречаться в описании несколько раз, номер строки в списке должен быть один
+    keys = keys[~pd.MultiIndex.from_arrays([keys.index, keys.to_numpy()]).duplicated()]
+    if keys.empty:
+        return {}
+    codes, uniques = pd.factorize(keys.to_numpy())
+    row_ids = keys.index.to_numpy(dtype=np.uint32)
+    # Стабильная сортировка по коду ключа сохраняет возрастающий порядок номеров строк внутри каждого ключа
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=len(uniques))
+    return dict(zip((str(key) for key in uniques), np.split(row_ids[order], np.cumsum(counts)[:-1])))
+
+
+def _build_postings(input_data: pd.DataFrame, first_row_id: int) -> Dict[str, Dict[str, np.ndarray]]:
+    """Функция строит списки номеров строк по словам "Описание" и по "MCC".
+    :param input_data: Данные в формате DataFrame с операциями.
+    :param first_row_id: Номер, с которого нумеруются строки input_data.
+    :return: Словарь {"description_tokens": {...}, "mcc": {...}}."""
+
+    row_ids = np.arange(first_row_id, first_row_id + len(input_data))
+
+    descriptions = pd.Series(input_data["Описание"].to_numpy(dtype=object), index=row_ids)
+    tokens = descriptions.str.lower().str.findall(TOKEN_PATTERN).explode()
+
+    # MCC в Excel-файле может быть как числом (5411.0), так и строкой ("5411"), привожу к строке из цифр
+    mcc_codes = pd.Series(pd.to_numeric(input_data["MCC"], errors="coerce").to_numpy(), index=row_ids).dropna()
+    mcc_codes = mcc_codes.astype(np.int64).astype(str)
+
+    return {"description_tokens": _group_row_ids(tokens), "mcc": _group_row_ids(mcc_codes)}
+
+
+def build_operations_search_index(input_data: pd.DataFrame) -> Dict[str, Any]:
+    """Функция строит инвертированный индекс операций: слово из "Описание" -> номера строк и MCC -> номера строк.
+    Номера строк - это позиции операций в input_data (для выборки через iloc).
+    :param input_data: Данные в формате DataFrame переданные из функции read_data_with_user_operations().
+    :return: Индекс в виде словаря с ключами "description_tokens", "mcc", "vocabulary", "substring_cache"
+    и "rows"."""
+
+    logger.debug("Построение инвертированного индекса по 'Описание' и 'MCC'")
+    search_index: Dict[str, Any] = _build_postings(input_data, first_row_id=0)
+    search_index["vocabulary"] = list(search_index["description_tokens"])
+    search_index["substring_cache"] = {}
+    search_index["rows"] = len(input_data)
+    logger.debug(
+        f"Индекс построен: слов - {len(search_index['description_tokens'])}, MCC - {len(search_index['mcc'])}"
+    )
+    return search_index
+
+
+def update_operations_search_index(search_index: Dict[str, Any], new_data: pd.DataFrame) -> None:
+    """Функция добавляет в индекс новые операции. Новые строки получают номера после уже проиндексированных,
+    поэтому вызывающий код должен добавлять new_data в конец своих данных (pd.concat(..., ignore_index=True)).
+    :param search_index: Индекс из build_operations_search_index() (изменяется на месте).
+    :param new_data: Новые операции."""
+
+    logger.debug(f"Добавление в индекс новых операций: {len(new_data)}")
+    new_postings = _build_postings(new_data, first_row_id=search_index["rows"])
+    for key in ("description_tokens", "mcc"):
+        postings = search_index[key]
+        for token, row_ids in new_postings[key].items():
+            # Номера новых строк больше всех существующих, поэтому после склейки массив остается отсортированным
+            postings[token] = np.concatenate((postings[token], row_ids)) if token in postings else row_ids
+    search_index["vocabulary"] = list(search_index["description_tokens"])
+    # Новые слова могли добавить совпадения по подстроке, поэтому кэш найденных слов сбрасываю
+    search_index["substring_cache"] = {}
+    search_index["rows"] += len(new_data)
+
+
+def _get_matched_tokens(search_index: Dict[str, Any], word: str) -> List[str]:
+    """Функция возвращает слова словаря индекса, в которые входит слово запроса как подстрока.
+    Словарь слов во много раз меньше количества операций, поэтому подстроку ищу по нему, а не по строкам.
+    Найденные слова запоминаю, чтобы повторные запросы не просматривали словарь заново.
+    :param search_index: Индекс из build_operations_search_index().
+    :param word: Слово запроса в нижнем регистре.
+    :return: Список слов словаря."""
+
+    substring_cache = search_index["substring_cache"]
+    with _substring_cache_lock:
+        matched_tokens = substring_cache.get(word)
+    if matched_tokens is not None:
+        return cast(List[str], matched_tokens)
+
+    matched_tokens = [token for token in search_index["vocabulary"] if word in token]
+    with _substring_cache_lock:
+        while len(substring_cache) >= SUBSTRING_CACHE_SIZE:
+            del substring_cache[next(iter(substring_cache))]
+        substring_cache[word] = matched_tokens
+    return matched_tokens
+
+
+def _normalize_mcc(mcc: Union[str, int, float]) -> str:
+    """Функция приводит MCC-код запроса к строке из цифр, как в индексе (5411.0 -> "5411").
+    :param mcc: MCC-код.
+    :return: MCC-код строкой."""
+
+    try:
+        return str(int(float(mcc)))
+    except ValueError:
+        return str(mcc)
+
+
+def search_operations(
+    search_index: Dict[str, Any],
+    input_data: pd.DataFrame,
+    text: Optional[str] = None,
+    mcc: Optional[Union[str, int, float]] = None,
+    start_date: Optional[pd.Timestamp] = None,
+    end_date: Optional[pd.Timestamp] = None,
+    cashback_rules: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Функция ищет операции по подстроке в "Описание" и/или по MCC и считает по найденным операциям сумму
+    расходов и кэшбэк. Каждое слово запроса ищется как подстрока слов описания, слова запроса объединяются по "И".
+    :param search_index: Индекс из build_operations_search_index().
+    :param input_data: Те же данные, по которым построен индекс, "Дата платежа" уже преобразована в datetime.
+    :param text: Строка для поиска в "Описание" (например, "Колхоз").
+    :param mcc: MCC-код (например, 5411, 5411.0 или "5411").
+    :param start_date: Дата начала диапазона по "Дата платежа" (необязательно).
+    :param end_date: Дата окончания диапазона по "Дата платежа" (необязательно).
+    :param cashback_rules: Правила кэшбэка из пользовательских настроек (необязательно).
+    :return: Словарь {"operations": DataFrame, "total_spent": сумма расходов, "cashback": кэшбэк}."""
+
+    logger.debug(f"Поиск операций: текст - {text}, MCC - {mcc}")
+    row_ids: Optional[np.ndarray] = None
+
+    if text:
+        words = _tokenize(text)
+        # В запросе без слов (например, "???") искать нечего, поэтому операций не найдено
+        if not words:
+            row_ids = np.array([], dtype=np.uint32)
+        for word in words:
+            matched_tokens = _get_matched_tokens(search_index, word)
+            postings = [search_index["description_tokens"][token] for token in matched_tokens]
+            word_row_ids = np.unique(np.concatenate(postings)) if postings else np.array([], dtype=np.uint32)
+            row_ids = word_row_ids if row_ids is None else np.intersect1d(row_ids, word_row_ids, assume_unique=True)
+
+    if mcc is not None:
+        mcc_row_ids = search_index["mcc"].get(_normalize_mcc(mcc), np.array([], dtype=np.uint32))
+        row_ids = mcc_row_ids if row_ids is None else np.intersect1d(row_ids, mcc_row_ids, assume_unique=True)
+
+    if row_ids is None:
+        row_ids = np.arange(len(input_data))
+    # Фильтрую по датам на массиве номеров строк, чтобы выбирать из DataFrame только итоговые операции
+    if start_date is not None or end_date is not None:
+        payment_dates = input_data["Дата платежа"].to_numpy()[row_ids]
+        in_range = np.ones(len(row_ids), dtype=bool)
+        if start_date is not None:
+            in_range &= payment_dates >= np.datetime64(pd.Timestamp(start_date))
+        if end_date is not None:
+            in_range &= payment_dates <= np.datetime64(pd.Timestamp(end_date))
+        row_ids = row_ids[in_range]
+    matched_operations = input_data.iloc[row_ids]
+
+    # Сумма расходов и кэшбэк считаются только по успешным расходным операциям
+    spending = matched_operations.loc[
+        (matched_operations["Статус"] == "OK") & (matched_operations["Сумма платежа"] < 0)
+    ]
+    logger.debug(f"Найдено операций: {len(matched_operations)}")
+    return {
+        "operations": matched_operations,
+        "total_spent": round(float(spending["Сумма платежа"].sum()), 2),
+        "cashback": round(float(calculate_operations_cashback(spending, cashback_rules).sum()), 2),
+    }
@@ -1,27 +1,136 @@
-import json
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import combinations
 from pathlib import Path
-from typing import Union
+from typing import Any, Callable, Dict, List, Optional, Union
 
+import numpy as np
 import pandas as pd
 
+from config import REPORTS_DIR, json_file_user_settings
 from logger import get_logger_for_services
-from src.utils import read_data_with_user_operations
+from src.currency_rates import convert_operations_to_rub
+from src.profiling import profile_stage, profiled
+from src.reports import generate_spending_reports, update_spending_reports
+from src.search import build_operations_search_index, search_operations
+from src.utils import (
+    calculate_operations_cashback,
+    calculate_rule_percents,
+    compile_cashback_rules,
+    dumps_json_response,
+    get_cached_for_dataset,
+    get_operations_dataset_version,
+    read_data_with_user_operations,
+    read_user_settings_for_exchange_rates_and_stock,
+)
 
 # Инициализирую логгер для services
 logger = get_logger_for_services(__name__)
 
 
-def get_cashback_analysis_by_category(file: Union[str, Path], user_year: str, user_month: str) -> str:
+def _sum_partition_cashback(categories: np.ndarray, cashback: np.ndarray) -> pd.Series:
+    """Функция считает частичные суммы кэшбэка по категориям для одной части данных: коды категорий части
+    получаются через pd.factorize, суммы - через np.bincount. Функция объявлена на уровне модуля, чтобы ее можно
+    было передать в процесс из пула.
+    :param categories: Категории (или коды категорий) операций части данных.
+    :param cashback: Кэшбэк операций части данных.
+    :return: Series {категория: сумма кэшбэка} по категориям, которые есть в части данных."""
+
+    category_codes, partition_categories = pd.factorize(categories)
+    # Операции без категории в последовательном расчете не учитываются (groupby пропускает NaN)
+    has_category = category_codes >= 0
+    category_sums = np.bincount(
+        category_codes[has_category], weights=cashback[has_category], minlength=len(partition_categories)
+    )
+    return pd.Series(category_sums, index=partition_categories)
+
+
+def _get_partition_numbers(sorted_data: pd.DataFrame, workers: int, partition_by: str) -> np.ndarray:
+    """Функция возвращает номер части (от 0 до workers - 1) для каждой операции.
+    :param sorted_data: Операции с колонкой "Номер карты" или "Дата платежа".
+    :param workers: Количество частей.
+    :param partition_by: Признак деления на части: "card" - хэш номера карты, "month" - месяц "Дата платежа".
+    :return: Массив номеров частей."""
+
+    if partition_by == "month":
+        payment_dates = pd.to_datetime(sorted_data["Дата платежа"], errors="coerce")
+        partition_keys = (payment_dates.dt.year * 12 + payment_dates.dt.month).fillna(0).to_numpy(dtype=np.int64)
+        return partition_keys % workers
+    # Хэш считаю только для уникальных номеров карт, а не для каждой операции
+    card_codes, cards = pd.factorize(sorted_data["Номер карты"])
+    card_partitions = pd.util.hash_array(np.asarray(cards, dtype=object)) % np.uint64(workers)
+    return np.append(card_partitions.astype(np.int64), 0)[card_codes]
+
+
+def aggregate_cashback_by_category(
+    sorted_data: pd.DataFrame, workers: int = 1, partition_by: str = "card", use_processes: bool = True
+) -> pd.Series:
+    """Функция суммирует кэшбэк по категориям. При workers > 1 операции один раз делятся на части по хэшу номера
+    карты (или по месяцу) через сортировку номеров частей, частичные суммы по категориям считаются параллельно
+    в пуле процессов (или потоков) над массивами NumPy, после чего складываются. Суммы округляются до копеек,
+    поэтому результат параллельного расчета совпадает с последовательным.
+    :param sorted_data: Успешные расходные операции с колонками "Категория" и "Рассчитанный кэшбэк"
+    (и "Номер карты" или "Дата платежа" для деления на части).
+    :param workers: Количество параллельных обработчиков (1 - последовательный расчет через groupby).
+    :param partition_by: Признак деления на части: "card" - хэш номера карты, "month" - месяц "Дата платежа".
+    :param use_processes: True - пул процессов, False - пул потоков.
+    :return: Series {категория: кэшбэк}, отсортированная по убыванию кэшбэка."""
+
+    if workers <= 1:
+        logger.debug("Последовательное суммирование кэшбэка по категориям")
+        category_cashback = sorted_data.groupby("Категория", observed=True)["Рассчитанный кэшбэк"].sum()
+        return pd.Series(category_cashback.round(2).sort_values(ascending=False))
+
+    logger.debug(f"Параллельное суммирование кэшбэка: обработчиков - {workers}, деление на части - {partition_by}")
+    category_values = sorted_data["Категория"].to_numpy(dtype=object)
+    cashback_values = sorted_data["Рассчитанный кэшбэк"].to_numpy(dtype=float)
+    partition_numbers = _get_partition_numbers(sorted_data, workers, partition_by)
+    category_labels = None
+    if use_processes:
+        # Передача строк в процесс через pickle обходится дороже их факторизации, поэтому в пул процессов передаю
+        # целочисленные коды категорий (операции без категории отбрасываю сразу). Потоки работают с теми же
+        # массивами без копирования и факторизуют категории своей части сами
+        category_codes, category_labels = pd.factorize(category_values)
+        has_category = category_codes >= 0
+        category_values, cashback_values = category_codes[has_category], cashback_values[has_category]
+        partition_numbers = partition_numbers[has_category]
+
+    # Сортирую операции по номеру части и режу на непрерывные части (без отдельной маски для каждой части)
+    partition_order = np.argsort(partition_numbers, kind="stable")
+    partition_bounds = np.searchsorted(partition_numbers[partition_order], np.arange(1, workers))
+    category_parts = np.split(category_values[partition_order], partition_bounds)
+    cashback_parts = np.split(cashback_values[partition_order], partition_bounds)
+
+    executor_class: Callable[..., Executor] = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        partial_results = list(executor.map(_sum_partition_cashback, category_parts, cashback_parts))
+
+    # Складываю частичные суммы по категориям (groupby упорядочивает категории так же, как последовательный расчет)
+    partial_sums = pd.concat(partial_results)
+    if category_labels is not None:
+        partial_sums.index = pd.Index(np.asarray(category_labels, dtype=object)[partial_sums.index.to_numpy(int)])
+    category_cashback = partial_sums.groupby(level=0).sum().astype(float)
+    category_cashback.index.name = "Категория"
+    category_cashback.name = "Рассчитанный кэшбэк"
+    return pd.Series(category_cashback.round(2).sort_values(ascending=False))
+
+
+@profiled("cashback_analysis")
+def get_cashback_analysis_by_category(
+    file: Union[str, Path], user_year: str, user_month: str, pretty: bool = False, workers: int = 1
+) -> str:
     """Функция позволяет проанализировать, какие категории были наиболее выгодными для выбора в качестве категорий
     повышенного кэшбэка.
     :param file: На вход поступает путь к данным с банковскими транзакциями для анализа (data).
     :param user_year: Пользователь устанавливает год (year) за который проводится анализ.
     :param user_month: Пользователь устанавливает месяц (month) за который проводится анализ.
+    :param pretty: True - JSON с отступами (для вывода в консоль), False - компактный JSON.
+    :param workers: Количество процессов для параллельного суммирования кэшбэка по категориям.
     :return: JSON с анализом, сколько на каждой категории можно заработать кэшбэка в указанном месяце года."""
 
     logger.debug("Установка фильтрации по году и месяцу")
     # Чтение excel-файла и создание DataFrame
-    df_all_user_operations = read_data_with_user_operations(path_to_file=file)
+    with profile_stage("read_data"):
+        df_all_user_operations = read_data_with_user_operations(path_to_file=file)
 
     # Преобразую столбец "Дата платежа" в datetime
     logger.debug("Преобразование столбца 'Дата платежа' в datetime для последующих операций фильтрации")
@@ -29,6 +138,10 @@ def get_cashback_analysis_by_category(file: Union[str, Path], user_year: str, us
         df_all_user_operations["Дата платежа"], format="%d.%m.%Y", errors="coerce"
     )
 
+    # Перевод операций в иностранной валюте в рубли по локальной таблице исторических курсов
+    with profile_stage("currency_normalization"):
+        df_all_user_operations = convert_operations_to_rub(df_all_user_operations)
+
     # Фильтрация полученного DataFrame по заданному году и месяцу
     logger.debug("Фильтрация полученного DataFrame по заданному году и месяцу")
     df_filtered_user_operations = df_all_user_operations[
@@ -43,18 +156,208 @@ def get_cashback_analysis_by_category(file: Union[str, Path], user_year: str, us
     ].copy()
     # Добавляю новую колонку "Рассчитанный кэшбэк" и определяю кэшбэк по каждой операции:
     # 1) Если значение есть, то беру его из файла.
-    # 2) Если значения нет, считаю 1 рубль на каждые 100 рублей расходов
+    # 2) Если значения нет, считаю по правилам кэшбэка из пользовательских настроек (по умолчанию 1 рубль
+    # на каждые 100 рублей расходов)
     logger.debug("Рассчет кэшбэка по каждой операции")
-    sorted_data["Рассчитанный кэшбэк"] = sorted_data.apply(
-        lambda row: row["Кэшбэк"] if pd.notnull(row["Кэшбэк"]) else abs(row["Сумма платежа"]) // 100, axis=1
-    )
+    user_settings = read_user_settings_for_exchange_rates_and_stock(path_to_file=json_file_user_settings)
+    cashback_rules = user_settings.get("cashback_rules")
+    with profile_stage("cashback"):
+        sorted_data["Рассчитанный кэшбэк"] = calculate_operations_cashback(sorted_data, cashback_rules)
 
     # Группирую по названию категории, суммирую кэшбэк этой категории и в конце сортирую по убыванию
     logger.debug("Группировка и суммирование кэшбэка по каждой категории")
-    category_cashback = sorted_data.groupby("Категория")["Рассчитанный кэшбэк"].sum().sort_values(ascending=False)
+    with profile_stage("groupby"):
+        category_cashback = aggregate_cashback_by_category(sorted_data, workers=workers)
 
     logger.info("Формирование итогового ответа в формате json")
-    response = category_cashback.to_dict()
+    response = dumps_json_response(category_cashback, pretty=pretty)
     logger.debug("Итоговый ответ успешно сформирован")
 
-    return json.dumps(response, ensure_ascii=False, indent=4)
+    return response
+
+
+def evaluate_boosted_category_sets(
+    input_data: pd.DataFrame, cashback_rules: Optional[Dict[str, Any]], candidate_sets: List[List[str]]
+) -> pd.DataFrame:
+    """Функция режима "что если": за один проход считает, сколько кэшбэка принес бы каждый вариант набора
+    повышенных категорий. Кэшбэк из файла не учитывается, так как он начислен при уже выбранных категориях.
+    :param input_data: Успешные расходные операции с колонками "Номер карты", "Дата платежа", "Категория",
+    "Сумма платежа" (и "MCC", если в правилах есть проценты по MCC).
+    :param cashback_rules: Правила кэшбэка из пользовательских настроек.
+    :param candidate_sets: Варианты наборов повышенных категорий.
+    :return: Данные в формате DataFrame с колонками "Категории" и "Кэшбэк" (по убыванию кэшбэка)."""
+
+    compiled_rules = compile_cashback_rules(cashback_rules)
+    spent = input_data["Сумма платежа"].abs().to_numpy()
+    # Процент без повышенных категорий и процент, если категория операции окажется повышенной
+    base_percents = calculate_rule_percents(input_data, compiled_rules, boosted_categories=[])
+    boosted_percents = np.maximum(base_percents, compiled_rules["boosted_percent"])
+
+    # Суммирую кэшбэк в матрицы (карта и месяц) x категория: месячный лимит применяется к карте за месяц
+    payment_dates = pd.to_datetime(input_data["Дата платежа"], errors="coerce")
+    frame = pd.DataFrame(
+        {
+            "card": input_data["Номер карты"].to_numpy(),
+            "month": (payment_dates.dt.year * 12 + payment_dates.dt.month).to_numpy(),
+            "category": input_data["Категория"].to_numpy(),
+            "base": (spent * base_percents) // 100,
+            "boosted": (spent * boosted_percents) // 100,
+        }
+    )
+    grouped = frame.groupby(["card", "month", "category"], dropna=False)[["base", "boosted"]].sum()
+    base_matrix = grouped["base"].unstack("category", fill_value=0)
+    boosted_matrix = grouped["boosted"].unstack("category", fill_value=0)
+    categories = base_matrix.columns
+
+    # Матрица выбора: строка - вариант набора, колонка - категория (1, если категория повышенная)
+    selection = np.zeros((len(candidate_sets), len(categories)))
+    for number, candidate_set in enumerate(candidate_sets):
+        positions = categories.get_indexer(pd.Index(candidate_set))
+        selection[number, positions[positions >= 0]] = 1.0
+
+    # Кэшбэк всех вариантов по каждой карте за месяц считается двумя матричными умножениями
+    totals = base_matrix.to_numpy() @ (1.0 - selection).T + boosted_matrix.to_numpy() @ selection.T
+    if compiled_rules["monthly_cap"] is not None:
+        totals = np.minimum(totals, float(compiled_rules["monthly_cap"]))
+
+    result = pd.DataFrame({"Категории": [list(candidate_set) for candidate_set in candidate_sets]})
+    result["Кэшбэк"] = totals.sum(axis=0)
+    return result.sort_values(by="Кэшбэк", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def get_best_boosted_categories(
+    file: Union[str, Path], user_year: str, user_month: str, boosted_count: int = 3, pretty: bool = False
+) -> str:
+    """Функция подбирает набор повышенных категорий, который принес бы больше всего кэшбэка в указанном месяце.
+    Перебираются все наборы из boosted_count категорий, по которым были расходы.
+    :param file: На вход поступает путь к данным с банковскими транзакциями для анализа (data).
+    :param user_year: Пользователь устанавливает год (year) за который проводится анализ.
+    :param user_month: Пользователь устанавливает месяц (month) за который проводится анализ.
+    :param boosted_count: Количество повышенных категорий в наборе.
+    :param pretty: True - JSON с отступами (для вывода в консоль), False - компактный JSON.
+    :return: JSON с 5 лучшими наборами категорий и кэшбэком по каждому из них."""
+
+    df_all_user_operations = read_data_with_user_operations(path_to_file=file)
+    df_all_user_operations["Дата платежа"] = pd.to_datetime(
+        df_all_user_operations["Дата платежа"], format="%d.%m.%Y", errors="coerce"
+    )
+    df_all_user_operations = convert_operations_to_rub(df_all_user_operations)
+
+    logger.debug("Фильтрация успешных расходных операций за заданный год и месяц")
+    sorted_data = df_all_user_operations.loc[
+        (df_all_user_operations["Дата платежа"].dt.year == int(user_year))
+        & (df_all_user_operations["Дата платежа"].dt.month == int(user_month))
+        & (df_all_user_operations["Статус"] == "OK")
+        & (df_all_user_operations["Сумма платежа"] < 0)
+    ]
+
+    user_settings = read_user_settings_for_exchange_rates_and_stock(path_to_file=json_file_user_settings)
+    categories = sorted(str(category) for category in sorted_data["Категория"].dropna().unique())
+    if not categories:
+        logger.info("В указанном месяце нет расходов по категориям, наборов для сравнения нет")
+        return dumps_json_response([], pretty=pretty)
+    candidate_sets = [list(candidate) for candidate in combinations(categories, min(boosted_count, len(categories)))]
+    logger.debug(f"Оценка вариантов наборов повышенных категорий: {len(candidate_sets)}")
+    cashback_rules = user_settings.get("cashback_rules")
+    best_sets = evaluate_boosted_category_sets(sorted_data, cashback_rules, candidate_sets).head(5)
+
+    logger.info("Формирование итогового ответа в формате json")
+    best_sets = best_sets.rename(columns={"Категории": "categories", "Кэшбэк": "cashback"})
+    return dumps_json_response(best_sets, pretty=pretty)
+
+
+@profiled("spending_reports")
+def get_spending_reports(
+    file: Union[str, Path],
+    reports_dir: Union[str, Path] = REPORTS_DIR,
+    new_operations_file: Union[str, Path, None] = None,
+) -> List[Path]:
+    """Функция формирует недельные и месячные отчеты о расходах по каждой карте за всю историю операций.
+    Если передан файл с новыми операциями, они добавляются к истории и перезаписываются только отчеты за периоды,
+    в которые попали новые операции.
+    :param file: На вход поступает путь к данным с банковскими транзакциями (data).
+    :param reports_dir: Директория для отчетов (по умолчанию data/reports).
+    :param new_operations_file: Путь к Excel-файлу с новыми операциями (необязательно).
+    :return: Список путей к записанным файлам отчетов."""
+
+    with profile_stage("read_data"):
+        df_all_user_operations = read_data_with_user_operations(path_to_file=file)
+        df_new_user_operations = None
+        if new_operations_file is not None:
+            df_new_user_operations = read_data_with_user_operations(path_to_file=new_operations_file)
+            df_all_user_operations = pd.concat([df_all_user_operations, df_new_user_operations], ignore_index=True)
+
+    df_all_user_operations["Дата платежа"] = pd.to_datetime(
+        df_all_user_operations["Дата платежа"], format="%d.%m.%Y", errors="coerce"
+    )
+    with profile_stage("currency_normalization"):
+        df_all_user_operations = convert_operations_to_rub(df_all_user_operations)
+
+    user_settings = read_user_settings_for_exchange_rates_and_stock(path_to_file=json_file_user_settings)
+    cashback_rules = user_settings.get("cashback_rules")
+    with profile_stage("reports"):
+        if df_new_user_operations is None:
+            logger.debug("Формирование отчетов за все периоды истории операций")
+            return generate_spending_reports(df_all_user_operations, reports_dir, cashback_rules)
+        logger.debug("Перезапись отчетов за периоды, в которые попали новые операции")
+        return update_spending_reports(df_all_user_operations, df_new_user_operations, reports_dir, cashback_rules)
+
+
+@profiled("search")
+def search_user_operations(
+    file: Union[str, Path],
+    text: Optional[str] = None,
+    mcc: Optional[Union[str, int, float]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    pretty: bool = False,
+) -> str:
+    """Функция ищет операции по подстроке в "Описание" и/или по MCC за диапазон дат и возвращает найденные
+    операции, сумму расходов и кэшбэк по ним. Инвертированный индекс строится один раз при загрузке новой версии
+    набора операций и дальше берется из кэша.
+    :param file: На вход поступает путь к данным с банковскими транзакциями (data).
+    :param text: Строка для поиска в "Описание" (например, "Колхоз").
+    :param mcc: MCC-код (например, 5411).
+    :param start_date: Дата начала диапазона по "Дата платежа" в формате "YYYY-MM-DD" (необязательно).
+    :param end_date: Дата окончания диапазона по "Дата платежа" в формате "YYYY-MM-DD" (необязательно).
+    :param pretty: True - JSON с отступами (для вывода в консоль), False - компактный JSON.
+    :return: JSON с ключами "operations", "total_spent" и "cashback"."""
+
+    dataset_version = get_operations_dataset_version(file)
+    with profile_stage("read_data"):
+        df_all_user_operations = read_data_with_user_operations(path_to_file=file)
+
+    df_all_user_operations["Дата платежа"] = pd.to_datetime(
+        df_all_user_operations["Дата платежа"], format="%d.%m.%Y", errors="coerce"
+    )
+    with profile_stage("currency_normalization"):
+        df_all_user_operations = convert_operations_to_rub(df_all_user_operations)
+
+    with profile_stage("search_index"):
+        search_index = get_cached_for_dataset(
+            ("search_index",), dataset_version, lambda: build_operations_search_index(df_all_user_operations)
+        )
+
+    user_settings = read_user_settings_for_exchange_rates_and_stock(path_to_file=json_file_user_settings)
+    with profile_stage("search"):
+        result = search_operations(
+            search_index,
+            df_all_user_operations,
+            text=text,
+            mcc=mcc,
+            start_date=pd.Timestamp(start_date) if start_date else None,
+            end_date=pd.Timestamp(end_date) if end_date else None,
+            cashback_rules=user_settings.get("cashback_rules"),
+        )
+
+    logger.info("Формирование итогового ответа в формате json")
+    operations = result["operations"]
+    operations_frame = operations.assign(
+        **{"Дата платежа": operations["Дата платежа"].dt.strftime("%d.%m.%Y")}
+    )[["Дата платежа", "Сумма платежа", "Категория", "Описание"]].rename(
+        columns={"Дата платежа": "date", "Сумма платежа": "amount", "Категория": "category", "Описание": "description"}
+    )
+    return dumps_json_response(
+        {"operations": operations_frame, "total_spent": result["total_spent"], "cashback": result["cashback"]},
+        pretty=pretty,
+    )
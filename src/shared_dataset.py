@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from logger import get_logger_for_shared_dataset
+
+# Инициализирую логгер для shared_dataset
+logger = get_logger_for_shared_dataset(__name__)
+
+# Имя файла с описанием текущего поколения общего набора операций
+META_FILE_NAME = "meta.json"
+
+# Подключенные в этом процессе наборы операций: {директория: (номер поколения, DataFrame)}
+_attached_operations: Dict[Path, Tuple[int, pd.DataFrame]] = {}
+
+# Форматы дат в Excel-файле с операциями
+DATE_COLUMNS_FORMATS = {"Дата операции": "%d.%m.%Y %H:%M:%S", "Дата платежа": "%d.%m.%Y"}
+
+
+def normalize_operations(input_data: pd.DataFrame) -> pd.DataFrame:
+    """Функция приводит колонки операций к типам, которые можно хранить в memory-mapped файлах:
+    даты - в datetime, строки - в category (коды + справочник значений), числа остаются как есть.
+    :param input_data: Данные в формате DataFrame переданные из функции read_data_with_user_operations().
+    :return: Нормализованные данные в формате DataFrame."""
+
+    logger.debug("Нормализация колонок операций пользователя")
+    normalized_data = input_data.copy()
+    for column, date_format in DATE_COLUMNS_FORMATS.items():
+        if column in normalized_data.columns:
+            normalized_data[column] = pd.to_datetime(normalized_data[column], format=date_format, errors="coerce")
+    for column in normalized_data.columns:
+        column_dtype = normalized_data[column].dtype
+        if column_dtype == object or pd.api.types.is_string_dtype(column_dtype):
+            normalized_data[column] = normalized_data[column].astype("category")
+    return normalized_data
+
+
+def get_shared_generation(shared_dir: Union[str, Path]) -> int:
+    """Функция возвращает номер текущего поколения общего набора операций. Рабочие процессы сравнивают его
+    со своим номером, чтобы понять, нужно ли заново подключиться к данным.
+    :param shared_dir: Директория с общим набором операций.
+    :return: Номер поколения или 0, если данные еще не записаны."""
+
+    try:
+        with open(Path(shared_dir) / META_FILE_NAME) as meta_file:
+            return int(json.load(meta_file)["generation"])
+    except FileNotFoundError:
+        return 0
+
+
+def publish_shared_operations(input_data: pd.DataFrame, shared_dir: Union[str, Path]) -> int:
+    """Функция один раз записывает нормализованные колонки операций в .npy-файлы нового поколения и увеличивает
+    счетчик поколений. Предыдущее поколение сохраняется, чтобы процессы, которые его еще читают, не сломались.
+    :param input_data: Данные в формате DataFrame переданные из функции read_data_with_user_operations().
+    :param shared_dir: Директория с общим набором операций.
+    :return: Номер записанного поколения."""
+
+    shared_dir = Path(shared_dir)
+    generation = get_shared_generation(shared_dir) + 1
+    generation_dir = shared_dir / f"generation_{generation}"
+    generation_dir.mkdir(parents=True, exist_ok=True)
+
+    normalized_data = normalize_operations(input_data)
+    logger.debug(f"Запись колонок операций в поколение {generation}")
+    columns: List[Dict[str, Any]] = []
+    for number, column in enumerate(normalized_data.columns):
+        file_name = f"column_{number}.npy"
+        series = normalized_data[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Для строк храню только коды, справочник значений небольшой и записывается в meta.json
+            np.save(generation_dir / file_name, np.asarray(series.cat.codes))
+            categories = [str(category) for category in series.cat.categories]
+            columns.append({"name": column, "file": file_name, "categories": categories})
+        else:
+            np.save(generation_dir / file_name, series.to_numpy())
+            columns.append({"name": column, "file": file_name})
+
+    # Сначала пишу meta.json во временный файл, а потом атомарно подменяю им текущий,
+    # чтобы рабочие процессы никогда не увидели наполовину записанное поколение
+    meta = {
+        "generation": generation,
+        "directory": generation_dir.name,
+        "rows": len(normalized_data),
+        "columns": columns,
+    }
+    temporary_meta_file = shared_dir / f"{META_FILE_NAME}.tmp"
+    with open(temporary_meta_file, "w") as meta_file:
+        json.dump(meta, meta_file, ensure_ascii=False)
+    os.replace(temporary_meta_file, shared_dir / META_FILE_NAME)
+
+    # Удаляю поколения старше предыдущего (открытые memory-mapped файлы продолжат работать и после удаления)
+    for old_generation_dir in shared_dir.glob("generation_*"):
+        if int(old_generation_dir.name.split("_")[1]) < generation - 1:
+            shutil.rmtree(old_generation_dir, ignore_errors=True)
+
+    logger.info(f"Общий набор операций записан, поколение {generation}")
+    return generation
+
+
+def attach_shared_operations(shared_dir: Union[str, Path]) -> Tuple[pd.DataFrame, int]:
+    """Функция подключается к текущему поколению общего набора операций. Числовые колонки и даты DataFrame
+    ссылаются на memory-mapped .npy-файлы без копирования, поэтому их физическая копия в памяти одна на все
+    процессы. Строковые колонки хранятся кодами, но возвращаются обычными колонками строк (пропуски - NaN), как
+    после чтения Excel-файла: код, который работает с операциями (fillna(""), groupby по карте и категории),
+    рассчитан на строки, а не на category. Строковые колонки - собственная память каждого процесса, поэтому
+    подключенный набор кэшируется в процессе до смены поколения, а вызывающему возвращается его поверхностная
+    копия (замена колонки в ней не меняет кэш).
+    :param shared_dir: Директория с общим набором операций.
+    :return: Кортеж (данные в формате DataFrame, номер поколения)."""
+
+    shared_dir = Path(shared_dir)
+    with open(shared_dir / META_FILE_NAME) as meta_file:
+        meta = json.load(meta_file)
+    generation = int(meta["generation"])
+    cache_key = shared_dir.resolve()
+    cached = _attached_operations.get(cache_key)
+    if cached is not None and cached[0] == generation:
+        return cached[1].copy(deep=False), generation
+
+    generation_dir = shared_dir / meta["directory"]
+    logger.debug(f"Подключение к поколению {generation} общего набора операций")
+    columns: Dict[str, Any] = {}
+    for column in meta["columns"]:
+        values = np.load(generation_dir / column["file"], mmap_mode="r")
+        if "categories" in column:
+            # Код -1 означает пропуск, он попадает на последний элемент справочника (NaN)
+            categories = np.array(column["categories"] + [np.nan], dtype=object)
+            columns[column["name"]] = categories[values]
+        else:
+            columns[column["name"]] = values
+    shared_data = pd.DataFrame(columns, copy=False)
+    _attached_operations[cache_key] = (generation, shared_data)
+    logger.debug("Подключение к общему набору операций выполнено")
+    return shared_data.copy(deep=False), generation
@@ -1,25 +1,53 @@
 import datetime
 import json
 import os
+import threading
+from collections import OrderedDict
+from functools import partial
 from pathlib import Path
-from typing import Union, Any, Dict
+from typing import Union, Any, Callable, Dict, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import requests
 from dotenv import load_dotenv
 
+from config import SHARED_OPERATIONS_DIR, currency_rates_cache_file, excel_file_user_operations
 from logger import get_logger_user_operations
+from src.quotes_transport import is_replay_mode, send_quote_request
+from src.shared_dataset import attach_shared_operations, get_shared_generation
+
+try:
+    import orjson
+except ImportError:  # orjson - необязательная зависимость, без нее используется стандартный json
+    orjson = None  # type: ignore[assignment]
 
 # Инициализирую логгер для utils
 logger = get_logger_user_operations(__name__)
 
 
-def read_data_with_user_operations(path_to_file: Union[str, Path]) -> pd.DataFrame:
+def read_data_with_user_operations(path_to_file: Union[str, Path], allow_shared: bool = True) -> pd.DataFrame:
     """Функция считывает банковские операции пользователя из Excel-файла и возвращает данные в DataFrame.
     :param path_to_file: Путь к Excel-файлу.
+    :param allow_shared: Разрешить подмену основного файла операций общим набором (False - всегда читать файл).
     :return: Данные в формате DataFrame или пустой DataFrame в случае ошибки.
+    Если в переменных окружения USE_SHARED_OPERATIONS=1, общий набор операций уже записан через
+    publish_shared_operations() и запрошен основной файл операций (excel_file_user_operations), то данные
+    не читаются из файла, а подключаются из memory-mapped файлов. Другие файлы (например, файл с новыми
+    операциями) всегда читаются из Excel.
     """
 
+    load_dotenv()
+    if (
+        allow_shared
+        and os.getenv("USE_SHARED_OPERATIONS") == "1"
+        and Path(path_to_file).resolve() == Path(excel_file_user_operations).resolve()
+        and get_shared_generation(SHARED_OPERATIONS_DIR) > 0
+    ):
+        logger.debug("Подключение к общему (memory-mapped) набору операций вместо чтения Excel-файла")
+        shared_operations, _ = attach_shared_operations(SHARED_OPERATIONS_DIR)
+        return shared_operations
+
     try:
         logger.debug("Начато открытие и считывание Excel данных")
         df_user_operations = pd.read_excel(path_to_file)
@@ -59,11 +87,257 @@ def greeting() -> str:
 
 
 
-def get_cards_info(input_data: pd.DataFrame) -> pd.DataFrame:
+def compile_cashback_rules(cashback_rules: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Функция преобразует правила кэшбэка из пользовательских настроек ("cashback_rules" в user_settings.json)
+    в таблицы для векторного расчета. Проценты указываются в процентах (1 - это 1 рубль со 100 рублей).
+    :param cashback_rules: Словарь с ключами "default_percent", "category_percents", "mcc_percents",
+    "boosted_categories", "boosted_percent", "monthly_cap" (все ключи необязательны).
+    :return: Словарь с процентом по умолчанию, таблицами процентов по категориям и MCC, повышенными категориями
+    и месячным лимитом кэшбэка."""
+
+    rules = cashback_rules or {}
+    mcc_percents = {int(mcc): percent for mcc, percent in rules.get("mcc_percents", {}).items()}
+    return {
+        "default_percent": float(rules.get("default_percent", 1)),
+        "category_percents": pd.Series(rules.get("category_percents", {}), dtype=float),
+        "mcc_percents": pd.Series(mcc_percents, dtype=float),
+        "boosted_categories": list(rules.get("boosted_categories", [])),
+        "boosted_percent": float(rules.get("boosted_percent", 5)),
+        "monthly_cap": rules.get("monthly_cap"),
+    }
+
+
+def calculate_rule_percents(
+    input_data: pd.DataFrame, compiled_rules: Dict[str, Any], boosted_categories: Optional[list] = None
+) -> np.ndarray:
+    """Функция определяет процент кэшбэка по каждой операции по скомпилированным правилам. Приоритет правил:
+    процент по умолчанию < процент категории < процент MCC, повышенная категория дает не меньше boosted_percent.
+    :param input_data: Данные в формате DataFrame с колонкой "Категория" (и "MCC", если есть правила по MCC).
+    :param compiled_rules: Правила из compile_cashback_rules().
+    :param boosted_categories: Повышенные категории (по умолчанию берутся из правил).
+    :return: Массив процентов кэшбэка."""
+
+    percents = np.full(len(input_data), compiled_rules["default_percent"])
+    if not compiled_rules["category_percents"].empty:
+        category_percents = input_data["Категория"].map(compiled_rules["category_percents"]).to_numpy(dtype=float)
+        percents = np.where(np.isnan(category_percents), percents, category_percents)
+    if not compiled_rules["mcc_percents"].empty and "MCC" in input_data.columns:
+        mcc_codes = pd.to_numeric(input_data["MCC"], errors="coerce")
+        mcc_percents = mcc_codes.map(compiled_rules["mcc_percents"]).to_numpy(dtype=float)
+        percents = np.where(np.isnan(mcc_percents), percents, mcc_percents)
+    if boosted_categories is None:
+        boosted_categories = compiled_rules["boosted_categories"]
+    if boosted_categories:
+        is_boosted = input_data["Категория"].isin(boosted_categories).to_numpy()
+        percents = np.where(is_boosted, np.maximum(percents, compiled_rules["boosted_percent"]), percents)
+    return percents
+
+
+def _apply_monthly_cashback_cap(input_data: pd.DataFrame, cashback: pd.Series, monthly_cap: float) -> pd.Series:
+    """Функция ограничивает кэшбэк по каждой карте в каждом календарном месяце лимитом monthly_cap.
+    Операции учитываются по порядку "Дата платежа": когда лимит исчерпан, дальнейшие операции месяца дают 0.
+    :param input_data: Данные в формате DataFrame с колонками "Номер карты" и "Дата платежа".
+    :param cashback: Кэшбэк по каждой операции без учета лимита.
+    :param monthly_cap: Месячный лимит кэшбэка по карте.
+    :return: Series с кэшбэком с учетом лимита."""
+
+    payment_dates = pd.to_datetime(input_data["Дата платежа"], errors="coerce")
+    # Порядок операций считаю по позициям, а не по меткам индекса (метки могут повторяться после pd.concat)
+    date_order = np.argsort(payment_dates.to_numpy(), kind="stable")
+    frame = pd.DataFrame(
+        {
+            "card": input_data["Номер карты"].to_numpy()[date_order],
+            "month": (payment_dates.dt.year * 12 + payment_dates.dt.month).to_numpy()[date_order],
+            "cashback": cashback.to_numpy(dtype=float)[date_order],
+        }
+    )
+    earned_before = (
+        frame.groupby(["card", "month"], sort=False, dropna=False)["cashback"].cumsum() - frame["cashback"]
+    )
+    capped_cashback = frame["cashback"].clip(upper=(monthly_cap - earned_before).clip(lower=0))
+    # Возвращаю кэшбэк в исходный порядок операций через обратную перестановку
+    restored_cashback = np.empty(len(frame))
+    restored_cashback[date_order] = capped_cashback.to_numpy()
+    return pd.Series(restored_cashback, index=input_data.index, name=cashback.name)
+
+
+def calculate_operations_cashback(
+    input_data: pd.DataFrame, cashback_rules: Optional[Dict[str, Any]] = None
+) -> pd.Series:
+    """Функция рассчитывает кэшбэк по каждой операции без построчного apply.
+    :param input_data: Данные в формате DataFrame с колонками "Кэшбэк" и "Сумма платежа".
+    :param cashback_rules: Правила кэшбэка из пользовательских настроек (необязательно).
+    :return: Series с рассчитанным кэшбэком (индекс совпадает с индексом input_data)."""
+
+    # 1) Если значение есть, то беру его из файла.
+    # 2) Если значения нет, считаю 1 рубль на каждые 100 рублей расходов (или процент по правилам кэшбэка)
+    if cashback_rules is None:
+        return input_data["Кэшбэк"].where(input_data["Кэшбэк"].notnull(), input_data["Сумма платежа"].abs() // 100)
+
+    compiled_rules = compile_cashback_rules(cashback_rules)
+    percents = calculate_rule_percents(input_data, compiled_rules)
+    rule_cashback = (input_data["Сумма платежа"].abs() * percents) // 100
+    cashback = input_data["Кэшбэк"].where(input_data["Кэшбэк"].notnull(), rule_cashback).astype(float)
+    if compiled_rules["monthly_cap"] is not None:
+        cashback = _apply_monthly_cashback_cap(input_data, cashback, float(compiled_rules["monthly_cap"]))
+    return cashback
+
+
+def get_operations_dataset_version(path_to_file: Union[str, Path]) -> Optional[Tuple[Any, ...]]:
+    """Функция возвращает версию набора операций для кэширования производных данных (индексов, оценок аномалий).
+    Для общего (memory-mapped) набора версия - номер поколения, для Excel-файла - время изменения и размер файла.
+    Так как суммы переводятся в рубли по локальной таблице курсов, ее версия тоже входит в версию набора.
+    :param path_to_file: Путь к Excel-файлу с операциями.
+    :return: Кортеж с версией или None, если версию определить нельзя (тогда данные не кэшируются)."""
+
+    load_dotenv()
+    if os.getenv("USE_SHARED_OPERATIONS") == "1" and get_shared_generation(SHARED_OPERATIONS_DIR) > 0:
+        operations_version: Tuple[Any, ...] = (
+            "shared",
+            str(SHARED_OPERATIONS_DIR),
+            get_shared_generation(SHARED_OPERATIONS_DIR),
+        )
+    else:
+        try:
+            file_stat = Path(path_to_file).stat()
+        except OSError:
+            return None
+        operations_version = ("file", str(path_to_file), file_stat.st_mtime_ns, file_stat.st_size)
+    try:
+        rates_stat = Path(currency_rates_cache_file).stat()
+        rates_version: Tuple[Any, ...] = (rates_stat.st_mtime_ns, rates_stat.st_size)
+    except OSError:
+        rates_version = ()
+    return operations_version + rates_version
+
+
+# Кэш производных данных по версии набора операций: {(название, версия набора): данные}. Порядок ключей - от давно
+# использованных к недавно использованным, при переполнении удаляются давно использованные данные
+_dataset_cache: "OrderedDict[Tuple[Any, ...], Any]" = OrderedDict()
+_dataset_cache_lock = threading.Lock()
+
+# Наибольшее количество данных в кэше (например, индексы карт для разных правил кэшбэка)
+DATASET_CACHE_SIZE = 8
+
+
+def get_cached_for_dataset(
+    name: Tuple[Any, ...], dataset_version: Optional[Tuple[Any, ...]], build: Callable[[], Any]
+) -> Any:
+    """Функция возвращает производные данные набора операций из кэша или строит их функцией build и запоминает.
+    При смене версии набора данные с тем же названием, построенные по старой версии, удаляются из кэша. В кэше
+    хранится не больше DATASET_CACHE_SIZE данных, при переполнении удаляются давно использованные.
+    :param name: Название данных (например, ("card_index", правила кэшбэка)).
+    :param dataset_version: Версия набора из get_operations_dataset_version() (None - без кэширования).
+    :param build: Функция без аргументов, которая строит данные.
+    :return: Данные из кэша или только что построенные."""
+
+    if dataset_version is None:
+        return build()
+    cache_key = (name, dataset_version)
+    with _dataset_cache_lock:
+        if cache_key in _dataset_cache:
+            _dataset_cache.move_to_end(cache_key)
+            return _dataset_cache[cache_key]
+
+    logger.debug(f"Построение данных '{name[0]}' для новой версии набора операций")
+    data = build()
+    with _dataset_cache_lock:
+        for stale_key in [key for key in _dataset_cache if key[0] == name]:
+            del _dataset_cache[stale_key]
+        _dataset_cache[cache_key] = data
+        while len(_dataset_cache) > DATASET_CACHE_SIZE:
+            _dataset_cache.popitem(last=False)
+    return data
+
+
+def build_card_prefix_index(
+    input_data: pd.DataFrame, cashback_rules: Optional[Dict[str, Any]] = None
+) -> Dict[str, np.ndarray]:
+    """Функция строит индекс накопленных сумм (prefix sums) расходов и кэшбэка по всем картам.
+    Операции сортируются по карте и "Дата платежа" и хранятся в общих массивах, карта занимает в них
+    непрерывный участок. Каждая операция получает ключ "код карты * M + номер дня", поэтому суммы по всем картам
+    за любой диапазон дат считаются двумя векторными бинарными поисками и вычитанием (см. query_card_prefix_index()).
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :param cashback_rules: Правила кэшбэка из пользовательских настроек (необязательно).
+    :return: Словарь с массивами "cards" (номера карт по возрастанию), "dates" (уникальные даты по возрастанию),
+    "keys" (ключи операций), "spent" и "cashback" (накопленные суммы, на один элемент длиннее "keys")."""
+
+    logger.debug("Сортировка операций пользователя для построения индекса накопленных сумм")
+    sorted_data = input_data.loc[
+        (input_data["Статус"] == "OK")
+        & (input_data["Сумма платежа"] < 0)
+        & input_data["Номер карты"].notnull()
+        & input_data["Дата платежа"].notnull()
+    ].copy()
+    sorted_data["Рассчитанный кэшбэк"] = calculate_operations_cashback(sorted_data, cashback_rules)
+
+    logger.debug("Построение общих массивов накопленных сумм по всем картам")
+    card_codes, cards = pd.factorize(sorted_data["Номер карты"].astype(str), sort=True)
+    date_codes, dates = pd.factorize(sorted_data["Дата платежа"].to_numpy(dtype="datetime64[ns]"), sort=True)
+    # Номер дня в запросе может быть равен количеству дат, поэтому множитель на единицу больше
+    keys = card_codes.astype(np.int64) * (len(dates) + 1) + date_codes
+    order = np.argsort(keys, kind="stable")
+    spent = sorted_data["Сумма платежа"].to_numpy(dtype=float)[order]
+    cashback = sorted_data["Рассчитанный кэшбэк"].to_numpy(dtype=float)[order]
+
+    card_index = {
+        "cards": np.asarray(cards, dtype=object),
+        "dates": np.asarray(dates, dtype="datetime64[ns]"),
+        "keys": keys[order],
+        "spent": np.concatenate(([0.0], np.cumsum(spent))),
+        "cashback": np.concatenate(([0.0], np.cumsum(cashback))),
+    }
+    logger.debug(f"Индекс накопленных сумм построен для {len(cards)} карт")
+    return card_index
+
+
+def query_card_prefix_index(
+    card_index: Dict[str, np.ndarray], start_date: pd.Timestamp, end_date: pd.Timestamp
+) -> pd.DataFrame:
+    """Функция возвращает расходы и кэшбэк по каждой карте за диапазон дат (включительно) по индексу
+    из build_card_prefix_index(). Границы диапазона ищутся сразу для всех карт без цикла по картам.
+    :param card_index: Индекс накопленных сумм по картам.
+    :param start_date: Дата начала диапазона.
+    :param end_date: Дата окончания диапазона.
+    :return: Данные в формате DataFrame с колонками "Номер карты", "Сумма расходов", "Рассчитанный кэшбэк"
+    (только карты, по которым есть операции в диапазоне)."""
+
+    dates = card_index["dates"]
+    first_day = np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date), "ns"), side="left")
+    after_last_day = np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date), "ns"), side="right")
+    card_offsets = np.arange(len(card_index["cards"]), dtype=np.int64) * (len(dates) + 1)
+    left = np.searchsorted(card_index["keys"], card_offsets + first_day, side="left")
+    right = np.searchsorted(card_index["keys"], card_offsets + after_last_day, side="left")
+
+    # Суммы в рублях с копейками, поэтому округляю разность накопленных сумм до 2 знаков,
+    # чтобы убрать погрешность вычитания чисел с плавающей точкой
+    has_operations = right > left
+    left, right = left[has_operations], right[has_operations]
+    return pd.DataFrame(
+        {
+            "Номер карты": card_index["cards"][has_operations],
+            "Сумма расходов": (card_index["spent"][right] - card_index["spent"][left]).round(2),
+            "Рассчитанный кэшбэк": (card_index["cashback"][right] - card_index["cashback"][left]).round(2),
+        }
+    )
+
+
+def get_cards_info(
+    input_data: pd.DataFrame,
+    card_index: Optional[Dict[str, np.ndarray]] = None,
+    date_range: Optional[Tuple[pd.Timestamp, pd.Timestamp]] = None,
+) -> pd.DataFrame:
     """Функция возвращает набор данных по каждой карте: последние 4 цифры карты, общая сумма расходов.
     :param input_data: Данные в формате DataFrame переданные из функции read_data_with_user_operations().
+    :param card_index: Индекс накопленных сумм из build_card_prefix_index() (необязательно).
+    :param date_range: Диапазон дат (начало, окончание) для расчета по индексу (необязательно).
     :return: Данные в формате DataFrame."""
 
+    # Если передан индекс накопленных сумм и диапазон дат, то считаю расходы по индексу без группировки
+    if card_index is not None and date_range is not None:
+        logger.debug("Расчет расходов по каждой карте по индексу накопленных сумм")
+        return query_card_prefix_index(card_index, *date_range)[["Номер карты", "Сумма расходов"]]
+
     # Сразу сортирую данные оставляя только успешные расходные операции
     logger.debug("Сортировка операций пользователя")
     sorted_data = input_data.loc[(input_data["Статус"] == "OK") & (input_data["Сумма платежа"] < 0)].copy()
@@ -82,19 +356,29 @@ def get_cards_info(input_data: pd.DataFrame) -> pd.DataFrame:
     return card_expenses
 
 
-def get_card_cashback(input_data: pd.DataFrame) -> pd.DataFrame:
+def get_card_cashback(
+    input_data: pd.DataFrame,
+    card_index: Optional[Dict[str, np.ndarray]] = None,
+    date_range: Optional[Tuple[pd.Timestamp, pd.Timestamp]] = None,
+    cashback_rules: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
     """Функция возвращает данные начисленного кэшбэка по каждой карте.
     :param input_data: Данные в формате DataFrame переданные из функции read_data_with_user_operations().
+    :param card_index: Индекс накопленных сумм из build_card_prefix_index() (необязательно).
+    :param date_range: Диапазон дат (начало, окончание) для расчета по индексу (необязательно).
+    :param cashback_rules: Правила кэшбэка из пользовательских настроек (при расчете по индексу правила уже
+    учтены в индексе).
     :return: Данные в формате DataFrame с колонками "Номер карты" и "Кэшбэк"."""
 
+    # Если передан индекс накопленных сумм и диапазон дат, то считаю кэшбэк по индексу без группировки
+    if card_index is not None and date_range is not None:
+        logger.debug("Расчет кэшбэка по каждой карте по индексу накопленных сумм")
+        return query_card_prefix_index(card_index, *date_range)[["Номер карты", "Рассчитанный кэшбэк"]]
+
     logger.debug("Сортировка операций пользователя")
     sorted_data = input_data.loc[(input_data["Статус"] == "OK") & (input_data["Сумма платежа"] < 0)].copy()
-    # Добавляю новую колонку "Рассчитанный кэшбэк" и определяю кэшбэк по каждой операции:
-    # 1) Если значение есть, то деру его из файла.
-    # 2) Если значения нет, считаю 1 рубль на каждые 100 рублей расходов
-    sorted_data["Рассчитанный кэшбэк"] = sorted_data.apply(
-        lambda row: row["Кэшбэк"] if pd.notnull(row["Кэшбэк"]) else abs(row["Сумма платежа"]) // 100, axis=1
-    )
+    # Добавляю новую колонку "Рассчитанный кэшбэк" и определяю кэшбэк по каждой операции
+    sorted_data["Рассчитанный кэшбэк"] = calculate_operations_cashback(sorted_data, cashback_rules)
     # Группирую по номеру карты и суммирую кэшбэк
     logger.debug("Группировка и суммирование кэшбэка по каждой карте")
     card_cashback = sorted_data.groupby(by="Номер карты", as_index=False).agg({"Рассчитанный кэшбэк": "sum"})
@@ -116,6 +400,199 @@ def filter_top_transactions(input_data: pd.DataFrame) -> pd.DataFrame:
     return top_5_data[["Дата платежа", "Сумма платежа", "Категория", "Описание"]]
 
 
+def _score_spending_anomalies(sorted_data: pd.DataFrame, window: int, min_periods: int) -> pd.Series:
+    """Функция рассчитывает z-оценку каждой расходной операции относительно предыдущих операций той же карты
+    в той же категории (скользящее окно из window операций, текущая операция в окно не входит).
+    :param sorted_data: Успешные расходные операции, отсортированные по "Дата платежа".
+    :param window: Количество предыдущих операций в окне.
+    :param min_periods: Минимальное количество операций в окне для расчета оценки.
+    :return: Series с z-оценкой (NaN, если истории недостаточно)."""
+
+    # Считаю по позициям строк, а не по индексу: индекс входных данных может содержать повторы
+    positions = pd.RangeIndex(len(sorted_data))
+    group_keys = [
+        pd.Series(sorted_data["Номер карты"].to_numpy(), index=positions),
+        pd.Series(sorted_data["Категория"].fillna("").to_numpy(), index=positions),
+    ]
+    spent = pd.Series(np.abs(sorted_data["Сумма платежа"].to_numpy(dtype=float)), index=positions)
+    # Сдвигаю суммы внутри группы на одну операцию, чтобы окно состояло только из предыдущих операций
+    previous_spent = spent.groupby(group_keys, sort=False).shift(1)
+    rolling_window = previous_spent.groupby(group_keys, sort=False).rolling(window, min_periods=min_periods)
+    # groupby().rolling() возвращает MultiIndex (ключи групп + позиция строки), оставляю только позицию
+    rolling_mean = rolling_window.mean().droplevel([0, 1]).reindex(positions)
+    rolling_std = rolling_window.std().droplevel([0, 1]).reindex(positions)
+    # Если все операции в окне одинаковые (std = 0), то оценку не считаю, чтобы не получить бесконечность
+    scores = (spent - rolling_mean) / rolling_std.replace(0, np.nan)
+    return pd.Series(scores.to_numpy(), index=sorted_data.index)
+
+
+def _prepare_anomaly_operations(input_data: pd.DataFrame) -> pd.DataFrame:
+    """Функция оставляет успешные расходные операции с номером карты и сортирует их по "Дата платежа".
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :return: Отсортированные данные в формате DataFrame."""
+
+    filtered_data = input_data.loc[
+        (input_data["Статус"] == "OK") & (input_data["Сумма платежа"] < 0) & input_data["Номер карты"].notnull()
+    ]
+    return filtered_data.sort_values(by="Дата платежа", kind="stable")
+
+
+def _select_spending_anomalies(sorted_data: pd.DataFrame, scores: pd.Series, threshold: float) -> pd.DataFrame:
+    """Функция отбирает операции, z-оценка которых превышает порог.
+    :param sorted_data: Отсортированные расходные операции.
+    :param scores: z-оценки операций из _score_spending_anomalies().
+    :param threshold: Порог z-оценки.
+    :return: Данные в формате DataFrame с колонками: "Дата платежа", "Номер карты", "Сумма платежа", "Категория",
+    "Описание", "Оценка аномалии"."""
+
+    is_anomaly = (scores > threshold).to_numpy()
+    anomalies = sorted_data.loc[is_anomaly, ["Дата платежа", "Номер карты", "Сумма платежа", "Категория"]]
+    descriptions = sorted_data["Описание"].to_numpy()[is_anomaly] if "Описание" in sorted_data else None
+    return anomalies.assign(**{"Описание": descriptions, "Оценка аномалии": scores.to_numpy()[is_anomaly].round(2)})
+
+
+def detect_spending_anomalies(
+    input_data: pd.DataFrame, window: int = 30, threshold: float = 3.0, min_periods: int = 5
+) -> pd.DataFrame:
+    """Функция находит необычные (аномально крупные) расходные операции по каждой карте и категории.
+    Для каждой операции считается z-оценка относительно скользящего окна предыдущих операций той же карты
+    в той же категории, расчет выполняется векторно через groupby().rolling() (без цикла по строкам).
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :param window: Количество предыдущих операций в окне.
+    :param threshold: Порог z-оценки, выше которого операция считается аномальной.
+    :param min_periods: Минимальное количество предыдущих операций для расчета оценки.
+    :return: Данные в формате DataFrame с аномальными операциями (см. _select_spending_anomalies())."""
+
+    logger.debug("Сортировка успешных расходных операций для поиска аномалий")
+    sorted_data = _prepare_anomaly_operations(input_data)
+    logger.debug("Расчет z-оценки операций по скользящему окну для каждой карты и категории")
+    scores = _score_spending_anomalies(sorted_data, window, min_periods)
+    anomalies = _select_spending_anomalies(sorted_data, scores, threshold)
+    logger.debug(f"Найдено аномальных операций: {len(anomalies)}")
+    return anomalies
+
+
+def build_anomaly_index(input_data: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Функция строит индекс для поиска аномалий за диапазон дат: успешные расходные операции упорядочены по группе
+    (карта и категория), а внутри группы - по "Дата платежа". Предыдущие операции группы в таком порядке идут
+    подряд, поэтому окно для любой операции берется срезом без пересчета по всей истории.
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :return: Словарь с массивами "positions" (позиции операций в input_data), "groups" (коды групп), "dates"
+    и "spent" (сумма расходов)."""
+
+    logger.debug("Построение индекса операций по картам и категориям для поиска аномалий")
+    is_spending = (
+        (input_data["Статус"] == "OK") & (input_data["Сумма платежа"] < 0) & input_data["Номер карты"].notnull()
+    ).to_numpy()
+    positions = np.flatnonzero(is_spending)
+    positions = positions[np.argsort(input_data["Дата платежа"].to_numpy()[positions], kind="stable")]
+
+    card_codes, _ = pd.factorize(input_data["Номер карты"].to_numpy()[positions])
+    category_codes, categories = pd.factorize(input_data["Категория"].fillna("").to_numpy()[positions])
+    groups = card_codes.astype(np.int64) * max(len(categories), 1) + category_codes
+    # Стабильная сортировка по группе сохраняет порядок по дате внутри группы
+    order = np.argsort(groups, kind="stable")
+    positions = positions[order]
+    return {
+        "positions": positions,
+        "groups": groups[order],
+        "dates": input_data["Дата платежа"].to_numpy(dtype="datetime64[ns]")[positions],
+        "spent": np.abs(input_data["Сумма платежа"].to_numpy(dtype=float)[positions]),
+    }
+
+
+def query_anomaly_index(
+    anomaly_index: Dict[str, np.ndarray],
+    input_data: pd.DataFrame,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    window: int = 30,
+    threshold: float = 3.0,
+    min_periods: int = 5,
+) -> pd.DataFrame:
+    """Функция находит аномальные операции за диапазон дат по индексу из build_anomaly_index() (результат тот же,
+    что у detect_spending_anomalies() с фильтром по диапазону). z-оценка считается только для операций диапазона:
+    для каждой из них берутся window предыдущих операций той же группы, поэтому время ответа зависит от размера
+    диапазона, а не от всей истории.
+    :param anomaly_index: Индекс из build_anomaly_index().
+    :param input_data: Те же данные, по которым построен индекс.
+    :param start_date: Дата начала диапазона.
+    :param end_date: Дата окончания диапазона.
+    :param window: Количество предыдущих операций в окне.
+    :param threshold: Порог z-оценки, выше которого операция считается аномальной.
+    :param min_periods: Минимальное количество предыдущих операций для расчета оценки.
+    :return: Данные в формате DataFrame с аномальными операциями за диапазон (см. _select_spending_anomalies())."""
+
+    dates, groups, spent = anomaly_index["dates"], anomaly_index["groups"], anomaly_index["spent"]
+    start, end = np.datetime64(pd.Timestamp(start_date), "ns"), np.datetime64(pd.Timestamp(end_date), "ns")
+    rows = np.flatnonzero((dates >= start) & (dates <= end))
+    # Матрица окна: строка - операция диапазона, колонки - номера предыдущих операций той же группы
+    group_starts = np.searchsorted(groups, groups[rows], side="left")
+    window_rows = rows[:, np.newaxis] - np.arange(1, window + 1)
+    in_window = window_rows >= group_starts[:, np.newaxis]
+    window_spent = np.where(in_window, spent[np.maximum(window_rows, 0)], 0.0)
+
+    counts = in_window.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = window_spent.sum(axis=1) / counts
+        squared_deviations = np.where(in_window, (window_spent - means[:, np.newaxis]) ** 2, 0.0)
+        stds = np.sqrt(squared_deviations.sum(axis=1) / (counts - 1))
+        # Если истории недостаточно или все операции в окне одинаковые (std = 0), то оценку не считаю
+        scores = np.where((counts >= min_periods) & (stds > 0), (spent[rows] - means) / stds, np.nan)
+
+    # Аномальные операции возвращаю в порядке "Дата платежа", как в detect_spending_anomalies()
+    is_anomaly = scores > threshold
+    anomaly_rows, anomaly_scores = rows[is_anomaly], scores[is_anomaly]
+    order = np.lexsort((anomaly_index["positions"][anomaly_rows], dates[anomaly_rows]))
+    anomaly_operations = input_data.iloc[anomaly_index["positions"][anomaly_rows][order]]
+    return _select_spending_anomalies(
+        anomaly_operations, pd.Series(anomaly_scores[order], index=anomaly_operations.index), threshold
+    )
+
+
+def get_anomaly_history_tail(input_data: pd.DataFrame, window: int = 30) -> pd.DataFrame:
+    """Функция возвращает последние window операций каждой карты в каждой категории. Этого достаточно, чтобы
+    проверять новые операции в update_spending_anomalies() без пересчета по всей истории.
+    :param input_data: Данные в формате DataFrame, где "Дата платежа" уже преобразована в datetime.
+    :param window: Количество предыдущих операций в окне.
+    :return: Данные в формате DataFrame (хвост истории операций)."""
+
+    sorted_data = _prepare_anomaly_operations(input_data)
+    return sorted_data.groupby([sorted_data["Номер карты"], sorted_data["Категория"].fillna("")], sort=False).tail(
+        window
+    )
+
+
+def update_spending_anomalies(
+    history_tail: pd.DataFrame,
+    new_data: pd.DataFrame,
+    window: int = 30,
+    threshold: float = 3.0,
+    min_periods: int = 5,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Функция проверяет на аномалии только новые операции, используя хвост истории из get_anomaly_history_tail().
+    :param history_tail: Хвост истории операций.
+    :param new_data: Новые операции (в том же формате, что и история).
+    :param window: Количество предыдущих операций в окне.
+    :param threshold: Порог z-оценки, выше которого операция считается аномальной.
+    :param min_periods: Минимальное количество предыдущих операций для расчета оценки.
+    :return: Кортеж (аномальные операции среди новых, обновленный хвост истории)."""
+
+    logger.debug("Инкрементальная проверка новых операций на аномалии")
+    new_operations = _prepare_anomaly_operations(new_data)
+    # Новые операции идут после истории, поэтому сортировать их вместе с хвостом не нужно
+    combined_data = pd.concat([history_tail, new_operations], ignore_index=True)
+    is_new_operation = np.arange(len(combined_data)) >= len(history_tail)
+
+    scores = _score_spending_anomalies(combined_data, window, min_periods)
+    anomalies = _select_spending_anomalies(
+        combined_data.loc[is_new_operation], scores.loc[is_new_operation], threshold
+    )
+    updated_tail = get_anomaly_history_tail(combined_data, window)
+    logger.debug(f"Найдено аномальных операций среди новых: {len(anomalies)}")
+    return anomalies, updated_tail
+
+
 def read_user_settings_for_exchange_rates_and_stock(path_to_file: Union[str, Path]) -> Dict[str, Any]:
     """Функция считывает из json-файла настройки пользователя для отображения валют и акций на веб-страницах.
     :param path_to_file: Путь к json-файлу.
@@ -156,7 +633,8 @@ def filter_exchange_rates_from_user_settings(user_settings: dict) -> list:
     logger.debug("Загрузка API ключа из .env файла")
     load_dotenv()
     api_key = os.getenv("API_KEY_EXCHANGE_RATES")
-    if not api_key:
+    # В режиме replay ответы берутся из хранилища без запросов к API, поэтому ключ не нужен
+    if not api_key and not is_replay_mode():
         logger.error("API_KEY_EXCHANGE_RATES не найден в переменных окружения.env")
         raise ValueError("API_KEY_EXCHANGE_RATES не найден в переменных окружения.env")
 
@@ -177,7 +655,9 @@ def filter_exchange_rates_from_user_settings(user_settings: dict) -> list:
                 "to": "RUB",
             }
             headers = {"apikey": api_key}
-            response = requests.request("GET", url, headers=headers, params=payload)
+            response = send_quote_request(
+                f"exchange_rates_{currency}", partial(requests.request, "GET", url, headers=headers, params=payload)
+            )
             if response.status_code != 200:
                 logger.error(f"Ошибка при запросе для валюты {currency}: {response.text}")
                 continue
@@ -204,7 +684,8 @@ def filter_stock_from_user_settings(user_settings: dict) -> list:
     logger.debug("Загрузка API ключа из .env файла")
     load_dotenv()
     api_key = os.getenv("API_KEY_STOCK_PRICES")
-    if not api_key:
+    # В режиме replay ответы берутся из хранилища без запросов к API, поэтому ключ не нужен
+    if not api_key and not is_replay_mode():
         logger.error("API_KEY_STOCK_PRICES не найден в переменных окружения.env")
         raise ValueError("API_KEY_STOCK_PRICES не найден в переменных окружения.env")
 
@@ -219,7 +700,7 @@ def filter_stock_from_user_settings(user_settings: dict) -> list:
     for stock in stock_list:
         try:
             url = f"http://api.marketstack.com/v1/intraday?access_key={api_key}&symbols={stock}"
-            response = requests.get(url)
+            response = send_quote_request(f"stock_prices_{stock}", partial(requests.get, url))
             if response.status_code != 200:
                 logger.error(f"Ошибка при запросе для акции {stock}: {response.text}")
                 continue
@@ -234,4 +715,57 @@ def filter_stock_from_user_settings(user_settings: dict) -> list:
             logger.error(f"Ошибка при запросе API цены для {stock}: {e}")
 
     logger.debug("Запросы к API завершены")
-    return total_result
\ No newline at end of file
+    return total_result
+
+
+def _dumps_json_value(value: Any) -> str:
+    """Функция сериализует одно значение ответа в компактную JSON-строку.
+    DataFrame и Series сериализуются pandas напрямую из колонок (без промежуточного списка словарей).
+    :param value: DataFrame, Series или обычный объект Python.
+    :return: JSON-строка."""
+
+    # pandas экранирует косую черту: "Ж/д билеты" -> "Ж\/д билеты". Это допустимый JSON, но текст ответа тогда
+    # не совпадает с ответом через json.dumps. В выводе pandas "/" встречается только экранированной, а обратная
+    # косая черта из данных всегда удваивается, поэтому такая замена не меняет значения строк
+    if isinstance(value, pd.DataFrame):
+        return str(value.to_json(orient="records", force_ascii=False)).replace("\\/", "/")
+    if isinstance(value, pd.Series):
+        return str(value.to_json(orient="index", force_ascii=False)).replace("\\/", "/")
+    if orjson is not None:
+        return str(orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8"))
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _to_plain_python(value: Any) -> Any:
+    """Функция преобразует DataFrame/Series в объекты Python для json.dumps (используется только для CLI).
+    :param value: DataFrame, Series или обычный объект Python.
+    :return: Список словарей, словарь или исходное значение."""
+
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict(orient="records")
+    if isinstance(value, pd.Series):
+        return value.to_dict()
+    return value
+
+
+def dumps_json_response(data: Any, pretty: bool = False) -> str:
+    """Функция формирует итоговый JSON-ответ.
+    :param data: Словарь с разделами ответа (значения могут быть DataFrame, Series или объектами Python),
+    либо отдельный DataFrame/Series.
+    :param pretty: True - ответ с отступами для вывода в консоль (CLI), False - компактный ответ.
+    :return: JSON-строка."""
+
+    if pretty:
+        logger.debug("Формирование JSON-ответа с отступами для вывода в консоль")
+        if isinstance(data, dict):
+            plain_data = {key: _to_plain_python(value) for key, value in data.items()}
+        else:
+            plain_data = _to_plain_python(data)
+        return json.dumps(plain_data, ensure_ascii=False, indent=4)
+
+    logger.debug("Формирование компактного JSON-ответа")
+    if isinstance(data, dict):
+        # Собираю JSON по разделам, чтобы DataFrame сериализовались колонками, а не через to_dict()
+        sections = [f"{_dumps_json_value(str(key))}:{_dumps_json_value(value)}" for key, value in data.items()]
+        return "{" + ",".join(sections) + "}"
+    return _dumps_json_value(data)
@@ -1,16 +1,25 @@
 import json
+from typing import Any, Dict
 
 import pandas as pd
 
 from config import excel_file_user_operations, json_file_user_settings
 from logger import get_logger_response_for_main_page
+from src.currency_rates import convert_operations_to_rub
+from src.profiling import profile_stage, profiled
 from src.utils import (
+    build_anomaly_index,
+    build_card_prefix_index,
+    dumps_json_response,
     filter_exchange_rates_from_user_settings,
     filter_stock_from_user_settings,
     filter_top_transactions,
+    get_cached_for_dataset,
     get_card_cashback,
     get_cards_info,
+    get_operations_dataset_version,
     greeting,
+    query_anomaly_index,
     read_data_with_user_operations,
     read_user_settings_for_exchange_rates_and_stock,
 )
@@ -19,10 +28,13 @@ from src.utils import (
 logger = get_logger_response_for_main_page(__name__)
 
 
-def response_for_main_page(date: str) -> str:
+@profiled("main_page")
+def response_for_main_page(date: str, pretty: bool = False, include_anomalies: bool = False) -> str:
     """Функция для страницы 'Главная' принимает на вход дату. И возвращает данные для вывода на веб-странице с
     начала месяца (на который выпадает входящая дата) по входящую дату.
     :param date: Входящая пользовательская дата для определения диапазона данных.
+    :param pretty: True - JSON с отступами (для вывода в консоль), False - компактный JSON.
+    :param include_anomalies: True - добавить в ответ раздел "anomalies" с необычными операциями за диапазон.
     :return: JSON-ответ для страницы 'Главная'."""
 
     # Преобразую входящую дату от пользователя в формат pandas.Timestamp для последующей фильтрации.
@@ -32,8 +44,13 @@ def response_for_main_page(date: str) -> str:
     end_date = pd.Timestamp(date)
     start_date = end_date.replace(day=1)
 
+    # Версию набора операций определяю до чтения данных: если набор изменится во время чтения, то новые данные
+    # будут сохранены в кэше под старой версией и перестроены при следующем запросе (а не наоборот)
+    dataset_version = get_operations_dataset_version(excel_file_user_operations)
+
     # Чтение excel-файла и создание DataFrame
-    df_all_user_operations = read_data_with_user_operations(path_to_file=excel_file_user_operations)
+    with profile_stage("read_data"):
+        df_all_user_operations = read_data_with_user_operations(path_to_file=excel_file_user_operations)
 
     # Преобразую столбец "Дата платежа" в datetime
     logger.debug("Преобразование столбца 'Дата платежа' в datetime для последующих операций фильтрации")
@@ -41,6 +58,10 @@ def response_for_main_page(date: str) -> str:
         df_all_user_operations["Дата платежа"], format="%d.%m.%Y", errors="coerce"
     )
 
+    # Перевод операций в иностранной валюте в рубли по локальной таблице исторических курсов
+    with profile_stage("currency_normalization"):
+        df_all_user_operations = convert_operations_to_rub(df_all_user_operations)
+
     # Фильтрация полученного DataFrame по сформированному диапазону от start_date до end_date
     logger.debug("Фильтрация полученного DataFrame по сформированному диапазону от start_date до end_date")
     df_filtered_operations = df_all_user_operations.loc[
@@ -50,48 +71,86 @@ def response_for_main_page(date: str) -> str:
     # Приветствие пользователя системы в зависимости от времени суток
     greeting_ = greeting()
 
-    # Получение инфо по каждой карте (последние 4 цифры, общая сумма расходов, кэшбэк)
+    # Чтение json-файла с пользовательскими настройками для валют, акций и правил кэшбэка
+    user_settings = read_user_settings_for_exchange_rates_and_stock(path_to_file=json_file_user_settings)
+
+    # Индекс накопленных сумм по картам строится один раз на версию набора операций и правил кэшбэка,
+    # а расходы и кэшбэк всех карт за диапазон считаются одним запросом к индексу
+    logger.debug("Получение индекса накопленных сумм расходов и кэшбэка по картам")
+    with profile_stage("card_index"):
+        cashback_rules = user_settings.get("cashback_rules")
+        card_index = get_cached_for_dataset(
+            ("card_index", json.dumps(cashback_rules, sort_keys=True)),
+            dataset_version,
+            lambda: build_card_prefix_index(df_all_user_operations, cashback_rules=cashback_rules),
+        )
+
+    # Получение инфо по каждой карте (последние 4 цифры, общая сумма расходов, кэшбэк) за диапазон по индексу.
     # Объединение итогового DataFrame по "Номер карты" данными из card_expenses и card_cashback
     logger.debug("Объединение итогового DataFrame по 'Номер карты' данными из card_expenses и card_cashback")
+    date_range = (start_date, end_date)
     cards = pd.merge(
-        get_cards_info(df_filtered_operations), get_card_cashback(df_filtered_operations), on="Номер карты", how="left"
+        get_cards_info(df_filtered_operations, card_index=card_index, date_range=date_range),
+        get_card_cashback(df_filtered_operations, card_index=card_index, date_range=date_range),
+        on="Номер карты",
+        how="left",
     )
-    # Преобразование данных карт в список словарей
-    logger.debug("Преобразование данных карт в список словарей с переименованием колонок для json-ответа")
-    cards_list = cards.rename(
+    # Переименование колонок данных карт для json-ответа (сериализуются сразу из колонок DataFrame)
+    logger.debug("Переименование колонок данных карт для json-ответа")
+    cards_frame = cards.rename(
         columns={"Номер карты": "last_digits", "Сумма расходов": "total_spent", "Рассчитанный кэшбэк": "cashback"}
-    ).to_dict(orient="records")
+    )
 
     # Получение топ-5 транзакций по сумме платежа
-    top_transactions = filter_top_transactions(df_filtered_operations)
-    # Преобразование данных топ-5 транзакций в список словарей
-    logger.debug("Преобразование данных топ-5 транзакций в список словарей с переименованием колонок для json-ответа")
-    top_transactions_list = top_transactions.rename(
+    with profile_stage("top_transactions"):
+        top_transactions = filter_top_transactions(df_filtered_operations)
+    # Преобразую даты в строку сразу для всей колонки (без цикла по транзакциям)
+    logger.debug("Преобразование даты в строку и переименование колонок топ-5 транзакций для json-ответа")
+    top_transactions_frame = top_transactions.assign(
+        **{"Дата платежа": top_transactions["Дата платежа"].dt.strftime("%d.%m.%Y")}
+    ).rename(
         columns={"Дата платежа": "date", "Сумма платежа": "amount", "Категория": "category", "Описание": "description"}
-    ).to_dict(orient="records")
-
-    # Преобразую даты в строку чтоб потом корректно работал json.dumps
-    logger.debug("Преобразование даты в строку чтоб потом корректно работал json.dumps")
-    for transaction in top_transactions_list:
-        transaction["date"] = transaction["date"].strftime("%d.%m.%Y")
-
-    # Чтение json-файла с пользовательскими настройками для валют и акций
-    user_settings = read_user_settings_for_exchange_rates_and_stock(path_to_file=json_file_user_settings)
+    )
 
     # Запрос по API данных о текущих курс валют, которые указаны в пользовательских настройках
-    currency_rates = filter_exchange_rates_from_user_settings(user_settings)
+    with profile_stage("currency_rates"):
+        currency_rates = filter_exchange_rates_from_user_settings(user_settings)
 
     # Запрос по API данных о стоимости акций из S&P500, которые указаны в пользовательских настройках
-    stock_prices = filter_stock_from_user_settings(user_settings)
+    with profile_stage("stock_prices"):
+        stock_prices = filter_stock_from_user_settings(user_settings)
 
     logger.info("Формирование итогового ответа в заданном формате")
-    response = {
+    response: Dict[str, Any] = {
         "greeting": greeting_,
-        "cards": cards_list,
-        "top_transactions": top_transactions_list,
+        "cards": cards_frame,
+        "top_transactions": top_transactions_frame,
         "currency_rates": currency_rates,
         "stock_prices": stock_prices,
     }
 
+    # Необязательный раздел с аномальными операциями: индекс операций по картам и категориям строится один раз
+    # на версию набора операций, а z-оценка считается только для операций из диапазона от start_date до end_date
+    if include_anomalies:
+        logger.debug("Поиск аномальных операций для необязательного раздела 'anomalies'")
+        with profile_stage("anomalies"):
+            anomaly_index = get_cached_for_dataset(
+                ("anomaly_index",), dataset_version, lambda: build_anomaly_index(df_all_user_operations)
+            )
+            anomalies = query_anomaly_index(anomaly_index, df_all_user_operations, start_date, end_date)
+        response["anomalies"] = anomalies.assign(
+            **{"Дата платежа": anomalies["Дата платежа"].dt.strftime("%d.%m.%Y")}
+        ).rename(
+            columns={
+                "Дата платежа": "date",
+                "Номер карты": "last_digits",
+                "Сумма платежа": "amount",
+                "Категория": "category",
+                "Описание": "description",
+                "Оценка аномалии": "score",
+            }
+        )
+
     logger.debug("Возврат итогового ответа в json-файле")
-    return json.dumps(response, ensure_ascii=False, indent=4)
+    with profile_stage("serialization"):
+        return dumps_json_response(response, pretty=pretty)
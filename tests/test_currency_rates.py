@@ -0,0 +1,132 @@
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+from src.currency_rates import (
+    convert_operations_to_rub,
+    normalize_operations_currency,
+    update_currency_rates_table,
+)
+
+
+def test_update_currency_rates_table_fetches_rates_in_rub(tmp_path: Path) -> None:
+    """Тест загрузки курсов валют одним запросом на период и пересчета в рубли за единицу валюты."""
+
+    mock_response = {"rates": {"2023-01-01": {"USD": 0.0125, "EUR": 0.01}, "2023-01-02": {"USD": 0.0128, "EUR": 0.01}}}
+    with (
+        patch("src.currency_rates.requests.request") as mock_request,
+        patch("src.currency_rates.os.getenv", return_value="test_key"),
+    ):
+        mock_request.return_value = MagicMock(status_code=200, json=MagicMock(return_value=mock_response))
+
+        result = update_currency_rates_table(
+            ["USD", "EUR"],
+            pd.Timestamp("2023-01-01"),
+            pd.Timestamp("2023-01-02"),
+            path_to_file=tmp_path / "currency_rates.csv",
+        )
+
+    assert mock_request.call_count == 1
+    assert mock_request.call_args.kwargs["params"]["symbols"] == "USD,EUR"
+    assert result.sort_values(by=["Валюта", "Дата"])["Курс"].tolist() == [100.0, 100.0, 80.0, 78.125]
+
+
+def test_update_currency_rates_table_fetches_only_missing_period(tmp_path: Path) -> None:
+    """Тест, что локальная таблица курсов дополняется только недостающим периодом и сохраняется на диск
+    вместе с загруженными периодами."""
+
+    cache_file = tmp_path / "currency_rates.csv"
+    pd.DataFrame({"Валюта": ["USD"], "Дата": ["2023-01-01"], "Курс": [80.0]}).to_csv(cache_file, index=False)
+    new_rates = pd.DataFrame({"Дата": ["2023-01-02"], "Валюта": ["USD"], "Курс": [81.0]})
+
+    with (
+        patch("src.currency_rates._fetch_currency_rates_window", return_value=new_rates) as mock_fetch,
+        patch("src.currency_rates.os.getenv", return_value="test_key"),
+    ):
+        result = update_currency_rates_table(
+            ["USD"], pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-02"), path_to_file=cache_file
+        )
+
+    mock_fetch.assert_called_once_with(["USD"], pd.Timestamp("2023-01-02"), pd.Timestamp("2023-01-02"), "test_key")
+    assert result["Курс"].tolist() == [80.0, 81.0]
+    assert pd.read_csv(cache_file)["Курс"].tolist() == [80.0, 81.0]
+    assert pd.read_csv(tmp_path / "currency_rates_periods.csv").values.tolist() == [
+        ["USD", "2023-01-01", "2023-01-01"],
+        ["USD", "2023-01-02", "2023-01-02"],
+    ]
+
+
+def test_update_currency_rates_table_records_empty_and_failed_periods(tmp_path: Path) -> None:
+    """Тест, что период без курсов (выходные) повторно не запрашивается, а период, запрос за который завершился
+    ошибкой, не запрашивается повторно в том же запуске."""
+
+    cache_file = tmp_path / "currency_rates.csv"
+    empty_rates = pd.DataFrame(columns=["Дата", "Валюта", "Курс"])
+
+    with (
+        patch("src.currency_rates._fetch_currency_rates_window", return_value=empty_rates) as mock_fetch,
+        patch("src.currency_rates.os.getenv", return_value="test_key"),
+    ):
+        for _ in range(2):
+            update_currency_rates_table(
+                ["USD"], pd.Timestamp("2023-01-07"), pd.Timestamp("2023-01-08"), path_to_file=cache_file
+            )
+    assert mock_fetch.call_count == 1
+
+    with (
+        patch("src.currency_rates._fetch_currency_rates_window", return_value=None) as mock_fetch,
+        patch("src.currency_rates.os.getenv", return_value="test_key"),
+    ):
+        for _ in range(2):
+            result = update_currency_rates_table(
+                ["EUR"], pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-08"), path_to_file=cache_file
+            )
+    assert mock_fetch.call_count == 1
+    assert result.empty
+
+
+@patch("src.currency_rates.requests.request")
+def test_convert_operations_to_rub_uses_only_local_table(
+    mock_request: MagicMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Тест, что перевод в рубли при обработке запроса не обращается к API и берет курсы из локальной таблицы."""
+
+    cache_file = tmp_path / "currency_rates.csv"
+    pd.DataFrame({"Валюта": ["USD"], "Дата": ["2023-01-01"], "Курс": [80.0]}).to_csv(cache_file, index=False)
+    monkeypatch.setattr("src.currency_rates.currency_rates_cache_file", cache_file)
+    input_data = pd.DataFrame(
+        {
+            "Дата платежа": pd.to_datetime(["2023-01-02", "2024-01-02"]),
+            "Сумма платежа": [-10.0, -1000.0],
+            "Валюта платежа": ["USD", "RUB"],
+        }
+    )
+
+    result = convert_operations_to_rub(input_data)
+
+    mock_request.assert_not_called()
+    assert result["Сумма платежа"].tolist() == [-800.0, -1000.0]
+
+
+def test_normalize_operations_currency_as_of_rates() -> None:
+    """Тест перевода сумм в рубли по последнему известному курсу на дату платежа."""
+
+    input_data = pd.DataFrame(
+        {
+            "Дата платежа": pd.to_datetime(["2023-01-01", "2023-01-03", "2023-01-05", "2022-12-01"]),
+            "Сумма платежа": [-10.0, -10.0, -1000.0, -10.0],
+            "Валюта платежа": ["USD", "USD", "RUB", "USD"],
+        }
+    )
+    rates_table = pd.DataFrame(
+        {"Валюта": ["USD", "USD"], "Дата": pd.to_datetime(["2023-01-01", "2023-01-02"]), "Курс": [80.0, 81.5]}
+    )
+
+    result = normalize_operations_currency(input_data, rates_table)
+
+    # Для 03.01 берется курс на 02.01, для 01.12.2022 курса нет, и сумма остается без изменений
+    assert result["Сумма платежа"].tolist() == [-800.0, -815.0, -1000.0, -10.0]
+    assert result["Валюта платежа"].tolist() == ["RUB", "RUB", "RUB", "USD"]
+    assert input_data["Сумма платежа"].tolist() == [-10.0, -10.0, -1000.0, -10.0]
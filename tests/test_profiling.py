@@ -0,0 +1,105 @@
+import cProfile
+import json
+import threading
+import tracemalloc
+from pathlib import Path
+
+from src.profiling import disable_profiling, enable_profiling, profile_stage, profiled
+
+
+def test_profile_stage_writes_results(tmp_path: Path) -> None:
+    """Тест записи pstats, collapsed stacks и сводки по пиковой памяти для вложенных этапов."""
+
+    @profiled("dashboard")
+    def run_dashboard() -> int:
+        with profile_stage("allocate"):
+            data = [0] * 1_000_000
+        return len(data)
+
+    enable_profiling(tmp_path)
+    try:
+        assert run_dashboard() == 1_000_000
+    finally:
+        disable_profiling()
+
+    assert len(list(tmp_path.glob("dashboard_*.pstats"))) == 1
+    assert len(list(tmp_path.glob("dashboard_*.collapsed"))) == 1
+    with open(next(tmp_path.glob("dashboard_*_memory.json"))) as memory_file:
+        records = json.load(memory_file)
+    assert [record["stage"] for record in records] == ["dashboard.allocate", "dashboard"]
+    # Список из миллиона элементов занимает около 7.6 МБ, пик внешнего этапа не меньше пика вложенного
+    assert records[0]["peak_memory_mb"] > 7
+    assert records[1]["peak_memory_mb"] >= records[0]["peak_memory_mb"]
+
+
+def test_profile_stage_disabled(tmp_path: Path) -> None:
+    """Тест, что при выключенном профилировании ничего не записывается."""
+
+    enable_profiling(tmp_path)
+    disable_profiling()
+    with profile_stage("dashboard"):
+        pass
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profile_stage_threads_do_not_mix_stages(tmp_path: Path) -> None:
+    """Тест, что этапы, выполняемые параллельно в разных потоках, не вкладываются друг в друга."""
+
+    both_started = threading.Barrier(2, timeout=10)
+
+    def run_stage(name: str) -> None:
+        with profile_stage(name):
+            both_started.wait()
+            with profile_stage("inner"):
+                both_started.wait()
+
+    enable_profiling(tmp_path)
+    try:
+        threads = [threading.Thread(target=run_stage, args=(name,)) for name in ("first", "second")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        disable_profiling()
+
+    for name in ("first", "second"):
+        with open(next(tmp_path.glob(f"{name}_*_memory.json"))) as memory_file:
+            records = json.load(memory_file)
+        assert [record["stage"] for record in records] == [f"{name}.inner", name]
+    # Профилировщик общий для процесса, pstats записывает этап, завершившийся последним
+    assert len(list(tmp_path.glob("*.pstats"))) == 1
+    assert not tracemalloc.is_tracing()
+
+
+def test_profile_stage_with_outside_profiler(tmp_path: Path) -> None:
+    """Тест, что при уже включенном стороннем профилировщике этап выполняется без ошибки."""
+
+    outside_profiler = cProfile.Profile()
+    outside_profiler.enable()
+    enable_profiling(tmp_path)
+    try:
+        with profile_stage("dashboard"):
+            pass
+    finally:
+        disable_profiling()
+        outside_profiler.disable()
+
+    assert len(list(tmp_path.glob("dashboard_*_memory.json"))) == 1
+    assert len(list(tmp_path.glob("dashboard_*.collapsed"))) == 1
+
+
+def test_enable_profiling_applies_to_views(tmp_path: Path) -> None:
+    """Тест, что профилирование, включенное через src.profiling, действует на этапы из src.views."""
+
+    from src import views
+
+    enable_profiling(tmp_path)
+    try:
+        with views.profile_stage("views_stage"):
+            pass
+    finally:
+        disable_profiling()
+
+    assert len(list(tmp_path.glob("views_stage_*.pstats"))) == 1
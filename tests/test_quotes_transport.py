@@ -0,0 +1,63 @@
+import json
+from pathlib import Path
+from typing import Iterator
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from src.quotes_transport import configure_quotes_transport, send_quote_request
+from src.utils import filter_exchange_rates_from_user_settings, filter_stock_from_user_settings
+
+
+@pytest.fixture
+def fixture_transport_store(tmp_path: Path) -> Iterator[Path]:
+    """Фикстура с временным хранилищем записанных ответов, после теста транспорт возвращается в режим live."""
+
+    yield tmp_path
+    configure_quotes_transport("live")
+
+
+def test_record_and_replay_quotes(fixture_user_settings: dict, fixture_transport_store: Path) -> None:
+    """Тест записи ответов API в хранилище и их воспроизведения без сети."""
+
+    mock_responses = [{"data": [{"last": 228.31}]}, {"data": [{"last": 1055.50}]}, {"data": [{"last": 2050}]}]
+    configure_quotes_transport("record", store_dir=fixture_transport_store)
+    with patch("requests.get") as mock_get, patch("src.utils.os.getenv", return_value="test_key"):
+        mock_get.side_effect = [
+            MagicMock(status_code=200, text=json.dumps(response), json=MagicMock(return_value=response))
+            for response in mock_responses
+        ]
+        recorded_result = filter_stock_from_user_settings(fixture_user_settings)
+
+    # Ключ API есть только в адресе запроса и в хранилище не попадает
+    assert "test_key" not in (fixture_transport_store / "stock_prices_AAPL.json").read_text(encoding="utf-8")
+
+    # В режиме replay ключ API не нужен
+    configure_quotes_transport("replay", store_dir=fixture_transport_store)
+    with (
+        patch("requests.get", side_effect=AssertionError("Запрос к сети в режиме replay")),
+        patch("src.utils.os.getenv", return_value=None),
+    ):
+        assert filter_stock_from_user_settings(fixture_user_settings) == recorded_result
+    assert recorded_result[0] == {"stock": "AAPL", "price": 228.31}
+
+
+def test_replay_simulated_errors(fixture_user_settings: dict, fixture_transport_store: Path) -> None:
+    """Тест имитации ошибок и отсутствия записанного ответа в режиме replay."""
+
+    (fixture_transport_store / "exchange_rates_USD.json").write_text(
+        json.dumps({"status_code": 200, "text": json.dumps({"result": 99.87})}), encoding="utf-8"
+    )
+    configure_quotes_transport("replay", store_dir=fixture_transport_store)
+    # Для EUR ответ не записан, такая валюта пропускается как при сетевой ошибке
+    with patch("src.utils.os.getenv", return_value="test_key"):
+        result = filter_exchange_rates_from_user_settings(fixture_user_settings)
+    assert result == [{"currency": "USD", "rate": 99.87}]
+
+    configure_quotes_transport("replay", store_dir=fixture_transport_store, error_rate=1.0, error_status=503)
+    assert send_quote_request("exchange_rates_USD", MagicMock()).status_code == 503
+
+    configure_quotes_transport("replay", store_dir=fixture_transport_store, error_rate=1.0)
+    with pytest.raises(requests.ConnectionError):
+        send_quote_request("exchange_rates_USD", MagicMock())
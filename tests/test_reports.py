@@ -0,0 +1,118 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from src.reports import generate_spending_reports, update_spending_reports
+
+
+def _make_operations(rows: list) -> pd.DataFrame:
+    """Функция собирает DataFrame операций для тестов отчетов из кортежей (дата операции, карта, сумма, категория)."""
+
+    return pd.DataFrame(
+        {
+            "Дата операции": [row[0] for row in rows],
+            "Дата платежа": pd.to_datetime([row[0][:10] for row in rows], format="%d.%m.%Y"),
+            "Номер карты": [row[1] for row in rows],
+            "Статус": "OK",
+            "Сумма платежа": [row[2] for row in rows],
+            "Кэшбэк": None,
+            "Категория": [row[3] for row in rows],
+        }
+    )
+
+
+def test_generate_spending_reports(tmp_path: Path) -> None:
+    """Тест формирования недельных и месячных отчетов по каждой карте за один проход."""
+
+    operations = _make_operations(
+        [
+            ("02.01.2023 10:15:00", "*1234", -1000.0, "Транспорт"),
+            ("03.01.2023 10:45:00", "*1234", -500.0, "Рестораны"),
+            ("04.01.2023 18:00:00", "*5678", -200.0, "Супермаркеты"),
+            ("09.01.2023 09:00:00", "*1234", -300.0, "Транспорт"),
+            ("10.01.2023 09:00:00", "*1234", 5000.0, "Пополнения"),
+        ]
+    )
+
+    written_files = generate_spending_reports(operations, tmp_path)
+
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in written_files) == [
+        "monthly/2023-01.json",
+        "weekly/2023-W01.json",
+        "weekly/2023-W02.json",
+    ]
+    with open(tmp_path / "weekly" / "2023-W01.json", encoding="utf-8") as report_file:
+        report = json.load(report_file)
+    card_report = report["cards"]["*1234"]
+    assert card_report["total_spent"] == 1500.0
+    assert card_report["cashback"] == 15.0
+    assert list(card_report["by_category"]) == ["Транспорт", "Рестораны"]
+    assert list(card_report["by_weekday"]) == ["Понедельник", "Вторник"]
+    assert card_report["by_hour"] == {"10": {"spent": 1500.0, "cashback": 15.0, "operations": 2}}
+
+    with open(tmp_path / "monthly" / "2023-01.json", encoding="utf-8") as report_file:
+        assert json.load(report_file)["cards"]["*1234"]["total_spent"] == 1800.0
+
+
+def test_update_spending_reports_regenerates_affected_periods(tmp_path: Path) -> None:
+    """Тест перезаписи только тех отчетов, в периоды которых попали новые операции."""
+
+    operations = _make_operations(
+        [
+            ("02.01.2023 10:15:00", "*1234", -1000.0, "Транспорт"),
+            ("09.01.2023 09:00:00", "*1234", -300.0, "Транспорт"),
+        ]
+    )
+    generate_spending_reports(operations, tmp_path)
+    new_operations = _make_operations([("10.01.2023 12:00:00", "*1234", -700.0, "Рестораны")])
+    all_operations = pd.concat([operations, new_operations], ignore_index=True)
+
+    written_files = update_spending_reports(all_operations, new_operations, tmp_path)
+
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in written_files) == [
+        "monthly/2023-01.json",
+        "weekly/2023-W02.json",
+    ]
+    with open(tmp_path / "weekly" / "2023-W02.json", encoding="utf-8") as report_file:
+        assert json.load(report_file)["cards"]["*1234"]["total_spent"] == 1000.0
+    # Результат совпадает с полной перегенерацией отчетов
+    full_dir = tmp_path / "full"
+    generate_spending_reports(all_operations, full_dir)
+    for period_file in ("monthly/2023-01.json", "weekly/2023-W01.json", "weekly/2023-W02.json"):
+        assert (tmp_path / period_file).read_text(encoding="utf-8") == (full_dir / period_file).read_text(
+            encoding="utf-8"
+        )
+
+
+def test_update_spending_reports_with_monthly_cap(tmp_path: Path) -> None:
+    """Тест, что при месячном лимите новая операция задним числом перезаписывает и другие недели того же месяца."""
+
+    cashback_rules = {"default_percent": 10, "monthly_cap": 150}
+    operations = _make_operations(
+        [
+            ("09.01.2023 10:00:00", "*1234", -1000.0, "Транспорт"),
+            ("16.01.2023 10:00:00", "*1234", -1000.0, "Транспорт"),
+            ("16.01.2023 11:00:00", "*5678", -1000.0, "Транспорт"),
+        ]
+    )
+    generate_spending_reports(operations, tmp_path, cashback_rules)
+    new_operations = _make_operations([("02.01.2023 12:00:00", "*1234", -1000.0, "Рестораны")])
+    all_operations = pd.concat([operations, new_operations], ignore_index=True)
+
+    written_files = update_spending_reports(all_operations, new_operations, tmp_path, cashback_rules)
+
+    # Новая операция съела часть лимита, поэтому кэшбэк за недели W02 и W03 тоже изменился
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in written_files) == [
+        "monthly/2023-01.json",
+        "weekly/2023-W01.json",
+        "weekly/2023-W02.json",
+        "weekly/2023-W03.json",
+    ]
+    full_dir = tmp_path / "full"
+    generate_spending_reports(all_operations, full_dir, cashback_rules)
+    for period_file in written_files:
+        relative_path = period_file.relative_to(tmp_path)
+        assert period_file.read_text(encoding="utf-8") == (full_dir / relative_path).read_text(encoding="utf-8")
+    with open(tmp_path / "weekly" / "2023-W03.json", encoding="utf-8") as report_file:
+        assert json.load(report_file)["cards"]["*1234"]["cashback"] == 0.0
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+
+from src.search import build_operations_search_index, search_operations, update_operations_search_index
+
+
+@pytest.fixture
+def operations_for_search() -> pd.DataFrame:
+    """Фикстура с операциями для поиска по "Описание" и "MCC"."""
+
+    return pd.DataFrame(
+        {
+            "Дата платежа": pd.to_datetime(["2023-01-10", "2023-02-15", "2023-04-01", "2023-04-02"]),
+            "Статус": ["OK", "OK", "FAILED", "OK"],
+            "Сумма платежа": [-1000.0, -250.0, -300.0, -150.0],
+            "Кэшбэк": [None, 5.0, None, None],
+            "Описание": ["Колхоз", "Колхозный рынок", "Колхоз", "Яндекс Такси"],
+            "MCC": [5411.0, 5411.0, 5411.0, 4121.0],
+        }
+    )
+
+
+def test_search_operations_by_description(operations_for_search: pd.DataFrame) -> None:
+    """Тест поиска по подстроке в "Описание" с подсчетом расходов и кэшбэка по успешным операциям."""
+
+    search_index = build_operations_search_index(operations_for_search)
+
+    result = search_operations(search_index, operations_for_search, text="колхоз")
+
+    assert list(result["operations"]["Описание"]) == ["Колхоз", "Колхозный рынок", "Колхоз"]
+    assert result["total_spent"] == -1250.0
+    assert result["cashback"] == 15.0
+    assert list(search_operations(search_index, operations_for_search, text="такси")["operations"].index) == [3]
+    assert search_operations(search_index, operations_for_search, text="колхоз рынок")["total_spent"] == -250.0
+
+
+def test_search_operations_by_mcc_and_date_range(operations_for_search: pd.DataFrame) -> None:
+    """Тест поиска по MCC за квартал."""
+
+    search_index = build_operations_search_index(operations_for_search)
+
+    result = search_operations(
+        search_index,
+        operations_for_search,
+        mcc=5411,
+        start_date=pd.Timestamp("2023-01-01"),
+        end_date=pd.Timestamp("2023-03-31"),
+    )
+
+    assert list(result["operations"]["Дата платежа"]) == list(pd.to_datetime(["2023-01-10", "2023-02-15"]))
+    assert result["total_spent"] == -1250.0
+
+
+def test_update_operations_search_index(operations_for_search: pd.DataFrame) -> None:
+    """Тест, что после добавления новых операций индекс совпадает с индексом, построенным заново."""
+
+    search_index = build_operations_search_index(operations_for_search.iloc[:2])
+    search_operations(search_index, operations_for_search.iloc[:2], text="такси")
+    update_operations_search_index(search_index, operations_for_search.iloc[2:])
+
+    result = search_operations(search_index, operations_for_search, text="такси", mcc="4121")
+    full_search_index = build_operations_search_index(operations_for_search)
+    expected_result = search_operations(full_search_index, operations_for_search, text="такси", mcc="4121")
+
+    pd.testing.assert_frame_equal(result["operations"], expected_result["operations"])
+    assert search_index["rows"] == 4
+    assert list(search_index["mcc"]["5411"]) == [0, 1, 2]
+
+
+def test_search_operations_without_words_and_float_mcc(operations_for_search: pd.DataFrame) -> None:
+    """Тест, что запрос без слов ничего не находит, а MCC-код можно передать числом с плавающей точкой."""
+
+    search_index = build_operations_search_index(operations_for_search)
+
+    assert search_operations(search_index, operations_for_search, text="???")["operations"].empty
+    assert list(search_operations(search_index, operations_for_search, mcc=5411.0)["operations"].index) == [0, 1, 2]
+
+
+def test_search_operations_substring_cache_is_bounded(
+    operations_for_search: pd.DataFrame, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Тест, что кэш совпадений по подстроке не растет больше SUBSTRING_CACHE_SIZE слов."""
+
+    monkeypatch.setattr("src.search.SUBSTRING_CACHE_SIZE", 2)
+    search_index = build_operations_search_index(operations_for_search)
+
+    for word in ("колхоз", "такси", "рынок", "яндекс"):
+        search_operations(search_index, operations_for_search, text=word)
+
+    assert list(search_index["substring_cache"]) == ["рынок", "яндекс"]
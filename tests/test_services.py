@@ -1,7 +1,18 @@
 import json
 from unittest.mock import patch, MagicMock
 
-from src.services import get_cashback_analysis_by_category
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.search import build_operations_search_index
+from src.services import (
+    aggregate_cashback_by_category,
+    evaluate_boosted_category_sets,
+    get_best_boosted_categories,
+    get_cashback_analysis_by_category,
+    search_user_operations,
+)
 
 
 @patch("src.services.read_data_with_user_operations")
@@ -23,3 +34,91 @@ def test_get_cashback_analysis_by_category_successful(
     result = get_cashback_analysis_by_category(file=file_path, user_year=user_year, user_month=user_month)
 
     assert json.loads(result) == expected_result
+
+
+def test_evaluate_boosted_category_sets(fixture_operations_data: pd.DataFrame) -> None:
+    """Тест режима "что если": кэшбэк каждого варианта набора повышенных категорий считается за один проход."""
+
+    cashback_rules = {"boosted_percent": 5, "monthly_cap": 55}
+    candidate_sets = [["Транспорт"], ["Рестораны"], ["Супермаркеты"], ["Транспорт", "Рестораны"]]
+
+    result = evaluate_boosted_category_sets(fixture_operations_data, cashback_rules, candidate_sets)
+
+    # Карта *1234: Транспорт 1000 (1% = 10, 5% = 50), Рестораны 500 (1% = 5, 5% = 25), лимит 55 в месяц.
+    # Карта *5678: Супермаркеты 200 (1% = 2, 5% = 10)
+    assert result["Категории"].tolist() == [["Транспорт"], ["Транспорт", "Рестораны"], ["Рестораны"], ["Супермаркеты"]]
+    assert result["Кэшбэк"].tolist() == [57.0, 57.0, 37.0, 25.0]
+
+
+@patch("src.services.read_data_with_user_operations")
+def test_get_best_boosted_categories(
+    mock_read_data_with_user_operations: MagicMock, fixture_operations_data: pd.DataFrame
+) -> None:
+    """Тест подбора лучшего набора повышенных категорий за месяц."""
+
+    mock_read_data_with_user_operations.return_value = fixture_operations_data
+
+    result = json.loads(get_best_boosted_categories("mock_path/operations.xlsx", "2023", "01", boosted_count=2))
+
+    assert result[0] == {"categories": ["Рестораны", "Транспорт"], "cashback": 77.0}
+    assert len(result) == 3
+
+
+@pytest.mark.parametrize("partition_by, use_processes", [("card", True), ("month", False)])
+def test_aggregate_cashback_by_category_parallel_matches_serial(partition_by: str, use_processes: bool) -> None:
+    """Тест параллельного суммирования кэшбэка: результат совпадает с последовательным расчетом."""
+
+    generator = np.random.default_rng(0)
+    rows = 5000
+    categories = np.array(["Транспорт", "Рестораны", "Супермаркеты", None], dtype=object)
+    sorted_data = pd.DataFrame(
+        {
+            "Номер карты": generator.choice(["*1234", "*5678", "*9012", "*3456"], rows),
+            "Дата платежа": pd.to_datetime("2023-01-01") + pd.to_timedelta(generator.integers(0, 365, rows), "D"),
+            "Категория": generator.choice(categories, rows),
+            "Рассчитанный кэшбэк": generator.integers(0, 10000, rows) / 100,
+        }
+    )
+
+    serial_result = aggregate_cashback_by_category(sorted_data)
+    parallel_result = aggregate_cashback_by_category(
+        sorted_data, workers=3, partition_by=partition_by, use_processes=use_processes
+    )
+
+    pd.testing.assert_series_equal(parallel_result, serial_result)
+
+
+@patch("src.services.read_data_with_user_operations")
+def test_get_best_boosted_categories_empty_month(
+    mock_read_data_with_user_operations: MagicMock, fixture_operations_data: pd.DataFrame
+) -> None:
+    """Тест подбора повышенных категорий за месяц без операций: возвращается пустой список."""
+
+    mock_read_data_with_user_operations.return_value = fixture_operations_data
+
+    assert json.loads(get_best_boosted_categories("mock_path/operations.xlsx", "2023", "02")) == []
+
+
+@patch("src.services.read_user_settings_for_exchange_rates_and_stock", return_value={})
+@patch("src.services.get_operations_dataset_version", return_value=("file", "operations.xlsx", 1))
+@patch("src.services.read_data_with_user_operations")
+def test_search_user_operations_builds_index_once(
+    mock_read_data: MagicMock,
+    mock_dataset_version: MagicMock,
+    mock_read_user_settings: MagicMock,
+    fixture_operations_data: pd.DataFrame,
+) -> None:
+    """Тест поиска операций: индекс строится один раз на версию набора операций."""
+
+    mock_read_data.side_effect = lambda path_to_file: fixture_operations_data.copy()
+
+    with patch("src.services.build_operations_search_index", wraps=build_operations_search_index) as mock_build:
+        result = json.loads(search_user_operations("operations.xlsx", text="магазин", start_date="2023-01-01"))
+        search_user_operations("operations.xlsx", mcc=5812.0)
+
+    assert mock_build.call_count == 1
+    assert result == {
+        "operations": [{"date": "01.01.2023", "amount": -200.0, "category": "Супермаркеты", "description": "Магазин"}],
+        "total_spent": -200.0,
+        "cashback": 2.0,
+    }
@@ -0,0 +1,140 @@
+import json
+from pathlib import Path
+from typing import Optional
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from config import excel_file_user_operations
+from src.shared_dataset import attach_shared_operations, get_shared_generation, publish_shared_operations
+from src.utils import detect_spending_anomalies, read_data_with_user_operations
+from src.views import response_for_main_page
+
+
+def test_publish_and_attach_shared_operations(
+    tmp_path: Path, fixture_dataframe_with_one_operation: pd.DataFrame
+) -> None:
+    """Тест записи общего набора операций и подключения к нему без копирования данных."""
+
+    assert get_shared_generation(tmp_path) == 0
+
+    generation = publish_shared_operations(fixture_dataframe_with_one_operation, tmp_path)
+    shared_data, attached_generation = attach_shared_operations(tmp_path)
+
+    assert generation == attached_generation == get_shared_generation(tmp_path) == 1
+    assert list(shared_data.columns) == list(fixture_dataframe_with_one_operation.columns)
+    assert shared_data["Дата платежа"].iloc[0] == pd.Timestamp("2021-12-31")
+    assert shared_data["Дата операции"].iloc[0] == pd.Timestamp("2021-12-31 16:44:00")
+    assert shared_data["Описание"].iloc[0] == "Колхоз"
+    assert pd.isnull(shared_data["Кэшбэк"].iloc[0])
+    # Колонка DataFrame ссылается на memory-mapped файл, а не на копию данных
+    values: Optional[np.ndarray] = shared_data["Дата платежа"].to_numpy()
+    while values is not None and not isinstance(values, np.memmap):
+        values = values.base
+    assert isinstance(values, np.memmap)
+
+
+def test_publish_shared_operations_new_generation(tmp_path: Path, fixture_operations_data: pd.DataFrame) -> None:
+    """Тест, что повторная запись создает новое поколение, а старые поколения удаляются."""
+
+    for _ in range(3):
+        publish_shared_operations(fixture_operations_data, tmp_path)
+
+    shared_data, generation = attach_shared_operations(tmp_path)
+
+    assert generation == 3
+    assert sorted(path.name for path in tmp_path.glob("generation_*")) == ["generation_2", "generation_3"]
+    pdt.assert_series_equal(
+        shared_data["Сумма платежа"], fixture_operations_data["Сумма платежа"], check_index_type=False
+    )
+
+
+def test_attach_shared_operations_cached_per_generation(
+    tmp_path: Path, fixture_operations_data: pd.DataFrame
+) -> None:
+    """Тест, что строковые колонки раскодируются один раз на поколение, а изменение возвращенной копии
+    не меняет кэш."""
+
+    publish_shared_operations(fixture_operations_data, tmp_path)
+    first_data, _ = attach_shared_operations(tmp_path)
+    first_data["Категория"] = "Изменено"
+    second_data, _ = attach_shared_operations(tmp_path)
+
+    assert second_data["Категория"].iloc[0] == fixture_operations_data["Категория"].iloc[0]
+    third_data, _ = attach_shared_operations(tmp_path)
+    assert np.shares_memory(second_data["Описание"].to_numpy(), third_data["Описание"].to_numpy())
+
+    publish_shared_operations(fixture_operations_data.iloc[:1], tmp_path)
+    new_data, generation = attach_shared_operations(tmp_path)
+    assert generation == 2
+    assert len(new_data) == 1
+
+
+@patch("pandas.read_excel")
+def test_read_other_file_with_shared_operations(
+    mock_read_excel: MagicMock,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    fixture_operations_data: pd.DataFrame,
+    fixture_dataframe_with_one_operation: pd.DataFrame,
+) -> None:
+    """Тест, что общий набор подменяет только основной файл операций, а другие файлы читаются из Excel."""
+
+    publish_shared_operations(fixture_operations_data, tmp_path)
+    monkeypatch.setenv("USE_SHARED_OPERATIONS", "1")
+    monkeypatch.setattr("src.utils.SHARED_OPERATIONS_DIR", tmp_path)
+    mock_read_excel.return_value = fixture_dataframe_with_one_operation
+
+    assert len(read_data_with_user_operations(excel_file_user_operations)) == len(fixture_operations_data)
+    assert len(read_data_with_user_operations("new_operations.xlsx")) == 1
+    assert len(read_data_with_user_operations(excel_file_user_operations, allow_shared=False)) == 1
+    assert mock_read_excel.call_count == 2
+
+
+@patch("src.views.filter_stock_from_user_settings", return_value=[])
+@patch("src.views.filter_exchange_rates_from_user_settings", return_value=[])
+@patch("src.views.read_user_settings_for_exchange_rates_and_stock", return_value={})
+def test_main_page_and_anomalies_on_attached_operations(
+    mock_read_user_settings: MagicMock,
+    mock_filter_exchange_rates: MagicMock,
+    mock_filter_stock: MagicMock,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Тест главной страницы и поиска аномалий на общем наборе операций: строки возвращаются обычными колонками,
+    покупки без категории не ломают расчет."""
+
+    amounts = [-100.0, -110.0, -90.0, -105.0, -95.0, -100.0, -5000.0, -102.0, -300.0]
+    operations = pd.DataFrame(
+        {
+            "Дата операции": [f"{day:02d}.05.2021 12:00:00" for day in range(1, len(amounts) + 1)],
+            "Дата платежа": [f"{day:02d}.05.2021" for day in range(1, len(amounts) + 1)],
+            "Номер карты": ["*1234"] * (len(amounts) - 1) + ["*5678"],
+            "Статус": ["OK"] * len(amounts),
+            "Сумма платежа": amounts,
+            "Валюта платежа": ["RUB"] * len(amounts),
+            "Кэшбэк": [None] * len(amounts),
+            "Категория": ["Супермаркеты"] * (len(amounts) - 1) + [None],
+            "Описание": ["Колхоз"] * len(amounts),
+        }
+    )
+    publish_shared_operations(operations, tmp_path)
+    monkeypatch.setenv("USE_SHARED_OPERATIONS", "1")
+    monkeypatch.setattr("src.utils.SHARED_OPERATIONS_DIR", tmp_path)
+
+    shared_data = read_data_with_user_operations(excel_file_user_operations)
+    assert shared_data["Категория"].dtype == object or pd.api.types.is_string_dtype(shared_data["Категория"])
+    assert pd.isnull(shared_data["Категория"].iloc[-1])
+
+    anomalies = detect_spending_anomalies(shared_data, window=5, min_periods=5)
+    assert list(anomalies["Сумма платежа"]) == [-5000.0]
+
+    result = json.loads(response_for_main_page("2021-05-20", include_anomalies=True))
+    assert result["cards"] == [
+        {"last_digits": "*1234", "total_spent": -5702.0, "cashback": 55.0},
+        {"last_digits": "*5678", "total_spent": -300.0, "cashback": 3.0},
+    ]
+    assert [anomaly["amount"] for anomaly in result["anomalies"]] == [-5000.0]
@@ -1,3 +1,5 @@
+import json
+from collections import OrderedDict
 from datetime import datetime
 from unittest.mock import MagicMock, patch, mock_open
 
@@ -6,14 +8,24 @@ import pandas.testing as pdt  # Импортирую функцию pd.testing 
 import pytest
 
 from src.utils import (
+    build_anomaly_index,
+    build_card_prefix_index,
+    calculate_operations_cashback,
+    detect_spending_anomalies,
+    dumps_json_response,
     filter_exchange_rates_from_user_settings,
     filter_stock_from_user_settings,
     filter_top_transactions,
     get_card_cashback,
+    get_anomaly_history_tail,
+    get_cached_for_dataset,
     get_cards_info,
     greeting,
     read_data_with_user_operations,
+    query_anomaly_index,
+    query_card_prefix_index,
     read_user_settings_for_exchange_rates_and_stock,
+    update_spending_anomalies,
 )
 
 
@@ -112,6 +124,96 @@ def test_get_card_cashback_successful(fixture_operations_data: pd.DataFrame, exp
     pdt.assert_frame_equal(result, expected_df)
 
 
+def test_card_prefix_index_matches_groupby(fixture_operations_data: pd.DataFrame) -> None:
+    """Тест, что расходы и кэшбэк по индексу накопленных сумм совпадают с расчетом через группировку."""
+
+    card_index = build_card_prefix_index(fixture_operations_data)
+    date_range = (pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-31"))
+
+    pdt.assert_frame_equal(
+        get_cards_info(fixture_operations_data, card_index=card_index, date_range=date_range),
+        get_cards_info(fixture_operations_data),
+    )
+    pdt.assert_frame_equal(
+        get_card_cashback(fixture_operations_data, card_index=card_index, date_range=date_range),
+        get_card_cashback(fixture_operations_data),
+    )
+
+
+def test_query_card_prefix_index_by_date_range() -> None:
+    """Тест расчета расходов и кэшбэка по индексу накопленных сумм за произвольный диапазон дат."""
+
+    input_data = pd.DataFrame(
+        {
+            "Дата платежа": pd.to_datetime(["2023-01-01", "2023-01-05", "2023-01-10", "2023-01-07"]),
+            "Номер карты": ["*1234", "*1234", "*1234", "*5678"],
+            "Статус": ["OK", "OK", "OK", "OK"],
+            "Сумма платежа": [-100.0, -250.5, -300.0, -1000.0],
+            "Кэшбэк": [None, None, 5.0, None],
+        }
+    )
+    card_index = build_card_prefix_index(input_data)
+
+    result = query_card_prefix_index(card_index, pd.Timestamp("2023-01-05"), pd.Timestamp("2023-01-10"))
+    expected_result = pd.DataFrame(
+        {
+            "Номер карты": ["*1234", "*5678"],
+            "Сумма расходов": [-550.5, -1000.0],
+            "Рассчитанный кэшбэк": [7.0, 10.0],
+        }
+    )
+    pdt.assert_frame_equal(result, expected_result)
+
+    # Диапазон, в который попадают операции только одной карты
+    result = query_card_prefix_index(card_index, pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-02"))
+    assert result.to_dict(orient="records") == [
+        {"Номер карты": "*1234", "Сумма расходов": -100.0, "Рассчитанный кэшбэк": 1.0}
+    ]
+
+
+def test_calculate_operations_cashback_with_rules(fixture_operations_data: pd.DataFrame) -> None:
+    """Тест расчета кэшбэка по правилам: процент категории, процент MCC и повышенная категория."""
+
+    cashback_rules = {
+        "category_percents": {"Транспорт": 3},
+        "mcc_percents": {"5411": 2},
+        "boosted_categories": ["Рестораны", "Супермаркеты"],
+        "boosted_percent": 5,
+    }
+
+    result = calculate_operations_cashback(fixture_operations_data, cashback_rules)
+
+    # Кэшбэк из файла (50.0) имеет приоритет над правилами, у "Супермаркеты" MCC 2% < повышенных 5%
+    assert list(result) == [30.0, 50.0, 10.0]
+    # Без правил расчет остается прежним: 1 рубль на каждые 100 рублей расходов
+    assert list(calculate_operations_cashback(fixture_operations_data)) == [10.0, 50.0, 2.0]
+
+
+def test_calculate_operations_cashback_monthly_cap() -> None:
+    """Тест ограничения кэшбэка по карте месячным лимитом."""
+
+    input_data = pd.DataFrame(
+        {
+            "Дата платежа": pd.to_datetime(["2023-01-01", "2023-01-02", "2023-01-03", "2023-02-01", "2023-01-02"]),
+            "Номер карты": ["*1234", "*1234", "*1234", "*1234", "*5678"],
+            "Сумма платежа": [-1000.0, -1000.0, -1000.0, -1000.0, -1000.0],
+            "Кэшбэк": [None, None, None, None, None],
+            "Категория": ["Рестораны"] * 5,
+        }
+    )
+
+    result = calculate_operations_cashback(input_data, {"default_percent": 10, "monthly_cap": 250})
+
+    assert list(result) == [100.0, 100.0, 50.0, 100.0, 100.0]
+
+    # Индекс с повторяющимися метками (после pd.concat) не мешает расчету: лимит считается по позициям операций
+    result = calculate_operations_cashback(
+        pd.concat([input_data, input_data]), {"default_percent": 10, "monthly_cap": 250}
+    )
+
+    assert list(result) == [100.0, 50.0, 0.0, 100.0, 100.0, 100.0, 0.0, 0.0, 100.0, 100.0]
+
+
 def test_filter_top_transactions_successful(fixture_operations_data: pd.DataFrame) -> None:
     """Тест для filter_top_transactions() с проверкой корректного выбора топ-5 транзакций."""
 
@@ -128,6 +230,65 @@ def test_filter_top_transactions_successful(fixture_operations_data: pd.DataFram
     pdt.assert_frame_equal(result, expected_data)
 
 
+@pytest.fixture
+def spending_history() -> pd.DataFrame:
+    """Фикстура с историей покупок по одной карте: обычные суммы и одна аномально крупная покупка."""
+
+    amounts = [-100.0, -110.0, -90.0, -105.0, -95.0, -100.0, -5000.0, -102.0]
+    return pd.DataFrame(
+        {
+            "Дата платежа": pd.date_range("2023-01-01", periods=len(amounts), freq="D"),
+            "Номер карты": ["*1234"] * len(amounts),
+            "Статус": ["OK"] * len(amounts),
+            "Сумма платежа": amounts,
+            "Категория": ["Супермаркеты"] * len(amounts),
+            "Описание": ["Колхоз"] * len(amounts),
+        }
+    )
+
+
+def test_detect_spending_anomalies(spending_history: pd.DataFrame) -> None:
+    """Тест поиска аномально крупной операции по скользящему окну предыдущих операций."""
+
+    result = detect_spending_anomalies(spending_history, window=5, threshold=3.0, min_periods=5)
+
+    assert list(result["Сумма платежа"]) == [-5000.0]
+    assert list(result["Дата платежа"]) == [pd.Timestamp("2023-01-07")]
+    assert result["Оценка аномалии"].iloc[0] > 3.0
+
+
+def test_update_spending_anomalies_matches_full_detection(spending_history: pd.DataFrame) -> None:
+    """Тест, что инкрементальная проверка новых операций совпадает с расчетом по всей истории."""
+
+    history, new_data = spending_history.iloc[:5], spending_history.iloc[5:]
+    history_tail = get_anomaly_history_tail(history, window=5)
+
+    anomalies, updated_tail = update_spending_anomalies(history_tail, new_data, window=5, min_periods=5)
+    expected_anomalies = detect_spending_anomalies(spending_history, window=5, min_periods=5)
+
+    pdt.assert_frame_equal(anomalies.reset_index(drop=True), expected_anomalies.reset_index(drop=True))
+    assert list(updated_tail["Сумма платежа"]) == [-105.0, -95.0, -100.0, -5000.0, -102.0]
+
+
+def test_query_anomaly_index_matches_full_detection(spending_history: pd.DataFrame) -> None:
+    """Тест, что поиск аномалий за диапазон дат по индексу совпадает с расчетом по всей истории,
+    в том числе при повторах в индексе строк."""
+
+    # Вторая карта с повторяющимся индексом строк, операции карт перемешаны по датам
+    second_card = spending_history.copy()
+    second_card["Номер карты"] = "*5678"
+    second_card["Сумма платежа"] = spending_history["Сумма платежа"] * 2
+    input_data = pd.concat([spending_history, second_card]).sort_values(by="Дата платежа", kind="stable")
+    start_date, end_date = pd.Timestamp("2023-01-06"), pd.Timestamp("2023-01-07")
+
+    anomaly_index = build_anomaly_index(input_data)
+    result = query_anomaly_index(anomaly_index, input_data, start_date, end_date, window=5, min_periods=5)
+    expected_result = detect_spending_anomalies(input_data, window=5, min_periods=5)
+
+    assert list(result["Сумма платежа"]) == [-5000.0, -10000.0]
+    pdt.assert_frame_equal(result.reset_index(drop=True), expected_result.reset_index(drop=True))
+
+
 @pytest.mark.parametrize(
     "mock_data, expected_settings",
     [
@@ -169,7 +330,7 @@ def test_filter_exchange_rates_successful(fixture_user_settings: dict) -> None:
         {"result": 105.311966},  # Ответ для EUR
     ]
     # Замокать requests.request, чтобы он возвращал заранее определённый результат
-    with patch("requests.request") as mock_request:
+    with patch("requests.request") as mock_request, patch("src.utils.os.getenv", return_value="test_key"):
         # Настраиваю side_effect, чтобы каждый вызов возвращал объект с json()
         mock_request.side_effect = [
             MagicMock(status_code=200, json=MagicMock(return_value=response)) for response in mock_responses
@@ -202,7 +363,7 @@ def test_filter_stock_prices_successful(fixture_user_settings: dict) -> None:
         {"data": [{"last": 2050}]},  # Ответ для GOOGL
     ]
     # Замокать requests.request, чтобы он возвращал заранее определённый результат
-    with patch("requests.get") as mock_get:
+    with patch("requests.get") as mock_get, patch("src.utils.os.getenv", return_value="test_key"):
         # Настраиваю side_effect, чтобы каждый вызов возвращал объект с json()
         mock_get.side_effect = [
             MagicMock(status_code=200, json=MagicMock(return_value=response)) for response in mock_responses
@@ -224,3 +385,64 @@ def test_filter_stock_prices_api_key_not_found(fixture_user_settings: dict) -> N
     with patch("src.utils.os.getenv", return_value=None):
         with pytest.raises(ValueError, match="API_KEY_STOCK_PRICES не найден в переменных окружения.env"):
             filter_stock_from_user_settings(fixture_user_settings)
+
+
+def test_dumps_json_response_compact_and_pretty() -> None:
+    """Тест формирования компактного JSON-ответа (из колонок DataFrame) и JSON-ответа с отступами для консоли."""
+
+    response = {
+        "greeting": "Добрый день",
+        "cards": pd.DataFrame({"last_digits": ["*1234"], "total_spent": [-1500.5], "cashback": [15.0]}),
+        "stock_prices": [{"stock": "AAPL", "price": 150.0}],
+    }
+    expected_result = {
+        "greeting": "Добрый день",
+        "cards": [{"last_digits": "*1234", "total_spent": -1500.5, "cashback": 15.0}],
+        "stock_prices": [{"stock": "AAPL", "price": 150.0}],
+    }
+
+    compact_result = dumps_json_response(response)
+    pretty_result = dumps_json_response(response, pretty=True)
+
+    assert "\n" not in compact_result
+    assert "Добрый день" in compact_result  # Кириллица не экранируется
+    assert json.loads(compact_result) == expected_result
+    assert pretty_result == json.dumps(expected_result, ensure_ascii=False, indent=4)
+    assert json.loads(dumps_json_response(pd.Series({"Рестораны": 50.0}))) == {"Рестораны": 50.0}
+
+
+def test_get_cached_for_dataset_rebuilds_only_on_new_version() -> None:
+    """Тест кэширования производных данных по версии набора операций."""
+
+    build = MagicMock(side_effect=["индекс 1", "индекс 2"])
+
+    assert get_cached_for_dataset(("card_index", "null"), ("file", "a.xlsx", 1), build) == "индекс 1"
+    assert get_cached_for_dataset(("card_index", "null"), ("file", "a.xlsx", 1), build) == "индекс 1"
+    assert get_cached_for_dataset(("card_index", "null"), ("file", "a.xlsx", 2), build) == "индекс 2"
+    assert build.call_count == 2
+
+
+def test_get_cached_for_dataset_evicts_least_recently_used(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Тест, что кэш производных данных ограничен и при переполнении удаляет давно использованные данные."""
+
+    monkeypatch.setattr("src.utils.DATASET_CACHE_SIZE", 2)
+    monkeypatch.setattr("src.utils._dataset_cache", OrderedDict())
+    build: MagicMock = MagicMock(side_effect=lambda: build.call_count)
+
+    for rules in ("правила 1", "правила 2", "правила 1", "правила 3", "правила 1", "правила 2"):
+        get_cached_for_dataset(("card_index", rules), ("file", "a.xlsx", 1), build)
+
+    # "правила 1" использовались недавно и остались в кэше, "правила 2" были вытеснены и построены заново
+    assert build.call_count == 4
+
+
+def test_dumps_json_response_does_not_escape_slash() -> None:
+    """Тест, что "/" в названиях категорий не экранируется и компактный ответ совпадает с json.dumps."""
+
+    category_cashback = pd.Series({"Ж/д билеты": 12.0, "Обратная \\/ черта": 1.0})
+    response = {"top_transactions": pd.DataFrame({"category": ["Ж/д билеты"], "amount": [-120.0]})}
+
+    assert dumps_json_response(category_cashback) == json.dumps(
+        {"Ж/д билеты": 12.0, "Обратная \\/ черта": 1.0}, ensure_ascii=False, separators=(",", ":")
+    )
+    assert dumps_json_response(response) == '{"top_transactions":[{"category":"Ж/д билеты","amount":-120.0}]}'